@@ -0,0 +1,233 @@
+# Benchmark.py measures how long each stage of a loop of the simulation
+# takes, and how long a whole loop takes, for a ladder of population sizes.
+# Speed is reported in agent-loops per second (the number of members times
+# the number of loops, divided by the time taken), so that sizes can be
+# compared with each other. The results can be saved as JSON and compared
+# with the results of an earlier version to find slowdowns.
+
+# The same stages of the list version in Covid19Simulation.py, which main()
+# runs, are timed too ("listStages"), at the sizes up to listMax, by default
+# the largest population setParameters() allows, since larger ones take far
+# too long. drawPeople() is left out, because drawing needs a Draw window.
+# Timing the list version needs the ElasticCollision module, so it is left
+# out if that is not installed, or with --list-max 0.
+
+# Every size uses a fixed seed, so every version is timed on exactly the
+# same populations. Before timing, the infected members are given random
+# infection lengths so that some are already contagious and can recover,
+# otherwise no infections or recoveries would happen during the short runs.
+
+# Usage:
+#   python Benchmark.py --sizes 100 1000 10000 100000 --output new.json
+#   python Benchmark.py --output new.json --compare old.json
+#   python Benchmark.py --list-max 0
+
+import argparse
+import json
+import platform
+import random
+import sys
+from time import perf_counter
+import numpy as np
+import Covid19Simulation as sim
+import VectorEngine
+
+#parameters of the benchmarked simulation, the defaults of main()
+PARAMS={"infecRate": 0.50, "vaccRate": 10.0, "vaccEffective": 50.0, \
+        "immunityRate": 50.0, "transmissionRate": 10.0, "deathRate": 0.00026}
+SIZES=(100, 1000, 10000, 100000)
+STAGES=("advanceInfection", "movePeople", "checkCollisions", "updateStatus", \
+        "updateInfec")
+
+# setUp() creates the population that is benchmarked for numPop members.
+
+def setUp(numPop, seed):
+    rng=np.random.default_rng(seed)
+    pop=VectorEngine.population(numPop, PARAMS["infecRate"], \
+                                PARAMS["vaccRate"], rng)
+    pop.timeSinceInfection[pop.infected]=rng.uniform( \
+        0, VectorEngine.RECOVERY+10, int(np.count_nonzero(pop.infected)))
+    return pop, rng
+
+# timeStages() runs loops loops on pop, timing each stage separately.
+# Returns a dictionary of the total seconds spent in each stage.
+
+def timeStages(pop, rng, loops):
+    seconds=dict.fromkeys(STAGES, 0.0)
+    for i in range(loops):
+        start=perf_counter()
+        VectorEngine.advanceInfection(pop)
+        moved=perf_counter()
+        VectorEngine.movePeople(pop)
+        collided=perf_counter()
+        collisions=VectorEngine.checkCollisions(pop)
+        infected=perf_counter()
+        VectorEngine.updateStatus(collisions, pop, PARAMS["transmissionRate"], \
+                                  PARAMS["vaccEffective"], rng)
+        updated=perf_counter()
+        VectorEngine.updateInfec(pop, PARAMS["deathRate"], \
+                                 PARAMS["immunityRate"], rng)
+        end=perf_counter()
+        seconds["advanceInfection"]+=moved-start
+        seconds["movePeople"]+=collided-moved
+        seconds["checkCollisions"]+=infected-collided
+        seconds["updateStatus"]+=updated-infected
+        seconds["updateInfec"]+=end-updated
+    return seconds
+
+# setUpList() creates the population that is benchmarked for numPop members
+# as the 2D list of the list version, with infection lengths given in the
+# same way as setUp(), and seeds the random module the list version draws
+# from.
+
+def setUpList(numPop, seed):
+    rng=random.Random(seed)
+    members=sim.population(numPop, PARAMS["infecRate"], PARAMS["vaccRate"], \
+                           rng)
+    for p in members:
+        if p[4]:
+            p[5]=rng.uniform(0, VectorEngine.RECOVERY+10)
+    random.seed(seed)
+    return members
+
+# timeListStages() runs loops loops on the 2D list members with the
+# functions main() calls, except for drawing, timing each stage separately.
+# Returns a dictionary of the total seconds spent in each stage.
+
+def timeListStages(members, loops):
+    seconds=dict.fromkeys(STAGES, 0.0)
+    numPop=len(members)
+    for i in range(loops):
+        start=perf_counter()
+        sim.advanceInfection(members)
+        moved=perf_counter()
+        sim.movePeople(members)
+        collided=perf_counter()
+        collisions=sim.checkCollisions(members)
+        infected=perf_counter()
+        sim.updateStatus(collisions, members, PARAMS["transmissionRate"], \
+                         PARAMS["vaccEffective"])
+        updated=perf_counter()
+        numPop=sim.updateInfec(members, PARAMS["deathRate"], numPop, \
+                               PARAMS["immunityRate"])
+        end=perf_counter()
+        seconds["advanceInfection"]+=moved-start
+        seconds["movePeople"]+=collided-moved
+        seconds["checkCollisions"]+=infected-collided
+        seconds["updateStatus"]+=updated-infected
+        seconds["updateInfec"]+=end-updated
+    return seconds
+
+# timeLoops() runs loops whole loops on pop with VectorEngine.step() and
+# returns the seconds taken.
+
+def timeLoops(pop, rng, loops):
+    start=perf_counter()
+    for i in range(loops):
+        VectorEngine.step(pop, PARAMS["transmissionRate"], \
+                          PARAMS["vaccEffective"], PARAMS["deathRate"], \
+                          PARAMS["immunityRate"], rng)
+    return perf_counter()-start
+
+# speed() returns the timing of loops loops of numPop members as a
+# dictionary of seconds and agent-loops per second.
+
+def speed(seconds, numPop, loops):
+    return {"seconds": seconds, "agentTicksPerSecond": \
+            numPop*loops/seconds if seconds>0 else float("inf")}
+
+# benchmark() times every stage and the whole loop for each population size
+# in sizes, over loops loops, and returns the results as a dictionary that
+# can be saved as JSON. The stages of the list version are also timed for
+# the sizes up to listMax, if ElasticCollision is installed.
+
+def benchmark(sizes=SIZES, loops=10, seed=0, listMax=sim.maxPop):
+    #run every stage once first, so that the first size is not also timing
+    #NumPy setting itself up
+    timeStages(*setUp(100, seed), 1)
+    results=[]
+    for numPop in sizes:
+        pop, rng=setUp(numPop, seed)
+        stages=timeStages(pop, rng, loops)
+        pop, rng=setUp(numPop, seed)
+        tick=timeLoops(pop, rng, loops)
+        result={"numPop": numPop, \
+                "stages": {name: speed(stages[name], numPop, loops) \
+                           for name in STAGES}, \
+                "tick": speed(tick, numPop, loops)}
+        if numPop<=listMax and sim.ElasticCollision is not None:
+            stages=timeListStages(setUpList(numPop, seed), loops)
+            result["listStages"]={name: speed(stages[name], numPop, loops) \
+                                  for name in STAGES}
+        results.append(result)
+    return {"version": 2, "loops": loops, "seed": seed, \
+            "python": platform.python_version(), "numpy": np.__version__, \
+            "results": results}
+
+# compare() compares the results of benchmark() for a new version with those
+# of an old version. Returns a list of descriptions of every stage, at every
+# size both have, that got more than tolerance (a fraction) slower.
+
+def compare(old, new, tolerance=0.2):
+    oldResults={result["numPop"]: result for result in old["results"]}
+    slower=[]
+    for result in new["results"]:
+        before=oldResults.get(result["numPop"])
+        if before is None:
+            continue
+        timings=[("tick", before["tick"], result["tick"])]
+        timings+=[(name, before["stages"][name], result["stages"][name]) \
+                  for name in STAGES if name in before["stages"]]
+        timings+=[("list "+name, before["listStages"][name], \
+                   result["listStages"][name]) for name in STAGES \
+                  if name in before.get("listStages", {}) and \
+                     name in result.get("listStages", {})]
+        for name, was, now in timings:
+            if now["agentTicksPerSecond"]< \
+               was["agentTicksPerSecond"]*(1-tolerance):
+                slower.append("%s at %d: %.3g -> %.3g agent-ticks/s" % \
+                              (name, result["numPop"], \
+                               was["agentTicksPerSecond"], \
+                               now["agentTicksPerSecond"]))
+    return slower
+
+# report() prints the results of benchmark() as a table.
+
+def report(results):
+    print("%8s %22s %12s %14s" % ("numPop", "stage", "seconds", \
+                                  "agent-ticks/s"))
+    for result in results["results"]:
+        timings=list(result["stages"].items())+[("tick", result["tick"])]
+        timings+=[("list "+name, timing) for name, timing in \
+                  result.get("listStages", {}).items()]
+        for name, timing in timings:
+            print("%8d %22s %12.4f %14.4g" % (result["numPop"], name, \
+                  timing["seconds"], timing["agentTicksPerSecond"]))
+
+def main(args=None):
+    parser=argparse.ArgumentParser(description="Benchmark the simulation.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--loops", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--list-max", type=int, default=sim.maxPop, \
+                        help="largest size to time the list version at")
+    parser.add_argument("--output", help="save the results to this file")
+    parser.add_argument("--compare", help="results of an earlier version")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args=parser.parse_args(args)
+
+    results=benchmark(args.sizes, args.loops, args.seed, args.list_max)
+    report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            slower=compare(json.load(f), results, args.tolerance)
+        for line in slower:
+            print("SLOWER:", line)
+        return 1 if slower else 0
+    return 0
+
+if __name__=="__main__":
+    sys.exit(main())
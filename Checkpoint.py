@@ -0,0 +1,128 @@
+# Checkpoint.py saves the whole state of a simulation run by the vector
+# engine to a file, and continues a simulation from such a file. The state
+# is the arrays of the population, the time, the number of loops run, the
+# parameters, and the state of the random number generator, so a simulation
+# that is continued from a checkpoint gives exactly the same results as if it
+# had never stopped. The parameters can also be changed when continuing, to
+# try different scenarios from the same starting point.
+
+# File layout:
+#   MAGIC
+#   4 byte length of the header, followed by the header as JSON
+#   the arrays of the population, each starting at a multiple of ALIGN bytes
+# The header records the dtype, offset, and length of every array, so the
+# arrays can be memory-mapped instead of read, and only the parts that are
+# used are loaded from disk.
+
+import json
+import os
+import struct
+import numpy as np
+import CounterRNG
+import VectorEngine
+import Headless
+
+MAGIC=b"C19CHECKPOINT"
+VERSION=1
+ALIGN=64
+
+# rngState() returns the state of rng, a NumPy Generator or a
+# CounterRNG.KeyedRandom, in a form that can be saved as JSON.
+
+def rngState(rng):
+    if CounterRNG.isKeyed(rng):
+        return {"bit_generator": "KeyedRandom", "key": rng.key, \
+                "tick": rng.tick}
+    return rng.bit_generator.state
+
+# saveCheckpoint() saves the state of a simulation to path. params holds the
+# parameters of Headless.runHeadless(). The file is written under a
+# temporary name first, so a crash never leaves half a checkpoint behind.
+
+def saveCheckpoint(path, pop, rng, day, hour, loops, params):
+    arrays={}
+    offset=0
+    for name in VectorEngine.FIELDS:
+        array=getattr(pop, name)
+        arrays[name]={"dtype": array.dtype.str, "offset": offset, \
+                      "length": len(array)}
+        offset+=-(-array.nbytes//ALIGN)*ALIGN
+    header=json.dumps({"version": VERSION, "day": day, "hour": hour, \
+                       "loops": loops, "params": params, \
+                       "rng": rngState(rng), \
+                       "arrays": arrays}).encode()
+    #the arrays start at the first multiple of ALIGN after the header
+    start=len(MAGIC)+4+len(header)
+    start=-(-start//ALIGN)*ALIGN
+
+    temp=path+".tmp"
+    with open(temp, "wb") as f:
+        f.write(MAGIC+struct.pack("<I", len(header))+header)
+        for name in VectorEngine.FIELDS:
+            f.seek(start+arrays[name]["offset"])
+            f.write(np.ascontiguousarray(getattr(pop, name)).tobytes())
+    os.replace(temp, path)
+
+# loadCheckpoint() loads the checkpoint at path. Returns a dictionary with
+# the population ("pop"), the random number generator ("rng"), "day",
+# "hour", "loops", and "params". If mmap is True the arrays of the population
+# are memory-mapped copy-on-write, so they can be changed without changing
+# the file.
+
+def loadCheckpoint(path, mmap=True):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC))!=MAGIC:
+            raise ValueError(path+" is not a checkpoint")
+        size,=struct.unpack("<I", f.read(4))
+        header=json.loads(f.read(size))
+    if header["version"]!=VERSION:
+        raise ValueError("unsupported checkpoint version "+ \
+                         str(header["version"]))
+    start=len(MAGIC)+4+size
+    start=-(-start//ALIGN)*ALIGN
+
+    columns=[]
+    for name in VectorEngine.FIELDS:
+        info=header["arrays"][name]
+        dtype=np.dtype(info["dtype"])
+        if info["length"]==0:
+            columns.append(np.zeros(0, dtype))
+        elif mmap:
+            columns.append(np.memmap(path, dtype=dtype, mode="c", \
+                                     offset=start+info["offset"], \
+                                     shape=(info["length"],)))
+        else:
+            columns.append(np.fromfile(path, dtype=dtype, \
+                                       count=info["length"], \
+                                       offset=start+info["offset"]))
+
+    if header["rng"]["bit_generator"]=="KeyedRandom":
+        rng=CounterRNG.KeyedRandom(header["rng"]["key"], header["rng"]["tick"])
+    else:
+        bitGenerator=getattr(np.random, header["rng"]["bit_generator"])()
+        bitGenerator.state=header["rng"]
+        rng=np.random.Generator(bitGenerator)
+    return {"pop": VectorEngine.Population(*columns), "rng": rng, \
+            "day": header["day"], "hour": header["hour"], \
+            "loops": header["loops"], "params": header["params"]}
+
+# resume() continues the simulation saved at path, in the same way as
+# Headless.runHeadless(), and returns the same tuple. Any parameter of the
+# simulation other than numPop, infecRate and vaccRate (which only affect the
+# start of a simulation) can be changed by passing it as a keyword, for
+# example resume("day30.c19", transmissionRate=5.0). The time series only
+# cover the loops run after the checkpoint.
+
+def resume(path, maxLoops=None, recorder=None, keepSeries=True, \
+           checkpointEvery=None, checkpointPath="checkpoint-{loop}.c19", \
+           mmap=True, hooks=None, **changes):
+    state=loadCheckpoint(path, mmap)
+    params=dict(state["params"])
+    for name in changes:
+        if name not in params or name in ("numPop", "infecRate", "vaccRate"):
+            raise ValueError("cannot change parameter "+repr(name))
+    params.update(changes)
+    return Headless.runVector(state["pop"], state["rng"], state["day"], \
+                              state["hour"], state["loops"], params, maxLoops, \
+                              recorder, keepSeries, checkpointEvery, \
+                              checkpointPath, hooks)
@@ -0,0 +1,82 @@
+# CounterRNG.py makes random numbers that depend only on what they are used
+# for, not on the order in which they are drawn. A KeyedRandom turns a seed,
+# the id of a member, the loop (tick), and a purpose (such as deciding if a
+# member dies) into a number between 0 and 1 by scrambling them together
+# with a hash function, instead of taking the next number from a stream.
+# Drawing the numbers of the same members in a different order, in chunks,
+# or on different processes therefore gives exactly the same numbers, so
+# runs of the serial and multi-process engines can be compared bit for bit.
+
+# The hash is the finalizer of SplitMix64, applied once for each part of the
+# key. It is a counter-based generator: the number for any key can be
+# computed directly, with no state other than the key.
+
+import numpy as np
+
+#purposes of the numbers drawn by VectorEngine
+X=0
+Y=1
+ANGLE=2
+INFECTED=3
+VACCINATED=4
+TRANSMIT=5
+OUTCOME=6
+STAYS=7
+
+GOLDEN=np.uint64(0x9e3779b97f4a7c15)
+MIX1=np.uint64(0xbf58476d1ce4e5b9)
+MIX2=np.uint64(0x94d049bb133111eb)
+
+# mix() scrambles the 64 bit integers in z. Arithmetic wraps around, as
+# NumPy arrays of unsigned integers do.
+
+def mix(z):
+    z=(z^(z>>np.uint64(30)))*MIX1
+    z=(z^(z>>np.uint64(27)))*MIX2
+    return z^(z>>np.uint64(31))
+
+# combine() mixes value, an array or a number, into the hashes in z.
+
+def combine(z, value):
+    value=np.asarray(value).astype(np.uint64)
+    return mix(z+(value+np.uint64(1))*GOLDEN)
+
+# KeyedRandom draws numbers keyed by (seed, member id, tick, purpose). tick
+# is the number of loops run so far, and is advanced by VectorEngine.step().
+# seed can be anything np.random.SeedSequence() accepts.
+
+class KeyedRandom:
+    keyed=True
+
+    def __init__(self, seed=None, tick=0):
+        if isinstance(seed, (int, np.integer)) and not \
+           isinstance(seed, (bool, np.bool_)) and 0<=seed<2**64:
+            self.key=int(seed)
+        else:
+            if not isinstance(seed, np.random.SeedSequence):
+                seed=np.random.SeedSequence(seed)
+            self.key=int(seed.generate_state(1, np.uint64)[0])
+        self.tick=tick
+
+    # uniform() returns a number between 0 and 1 (not including 1) for each
+    # member in ids, for purpose in the current tick. For numbers that belong
+    # to a pair of members, the ids of the other members are given as other;
+    # the pair gives the same number whichever member comes first.
+
+    def uniform(self, purpose, ids, other=None):
+        ids=np.asarray(ids, dtype=np.int64)
+        if other is not None:
+            other=np.asarray(other, dtype=np.int64)
+            ids, other=np.minimum(ids, other), np.maximum(ids, other)
+        with np.errstate(over="ignore"):
+            z=combine(np.full(ids.shape, self.key, np.uint64), self.tick)
+            z=combine(z, purpose)
+            z=combine(z, ids)
+            if other is not None:
+                z=combine(z, other)
+        return (z>>np.uint64(11)).astype(np.float64)*2.0**-53
+
+# isKeyed() returns whether rng is a KeyedRandom, or something like it.
+
+def isKeyed(rng):
+    return getattr(rng, "keyed", False)
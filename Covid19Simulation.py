@@ -11,7 +11,7 @@
 # values based on real data on the coronavirus pandemic.
 
 # Limitations on the accuracy of the simulation include, but are not limited to:
-# 1. A cap on population size.
+# 1. A cap on population size (maxPop).
 # 2. The population is completely isolated and has no influx of other, 
 #    potentially infected, members.
 # 3. The conditions which lead to a change in the status of an infected
@@ -32,10 +32,24 @@
 #     and how to “flatten the curve." 14 March 2020.
 #     https://www.washingtonpost.com/graphics/2020/world/corona-simulator/?tid=a_classic-iphone&no_nav=true
 
-import Draw
 import random
 import math
-import ElasticCollision
+#Draw is only needed to draw the simulation, and ElasticCollision to bounce
+#members in checkCollisions(), so the rest of the model can be imported and
+#run on computers that have neither
+try:
+    import Draw
+except ImportError:
+    Draw=None
+try:
+    import ElasticCollision
+except ImportError:
+    ElasticCollision=None
+
+#largest population size that can be chosen in setParameters(). Finding
+#collisions takes time proportional to the population size, so this can be
+#raised as far as the speed of drawing the members allows.
+maxPop=1000
 
 # Population() creates a 2D List, whose rows represent members of a
 # population. The columns represent the characteristics of each member,
@@ -43,61 +57,62 @@ import ElasticCollision
 # are infected with Covid-19, how long their infection has lasted, whether or 
 # not they are vaccinated, and whether or not they have antibodies and
 # therefore are immune.
-
-def population(numPop, infecRate, vaccRate):
-    members=[]
+# rng is the source of random numbers: None uses the random module, a number
+# is used as the seed of a new random.Random, and a random.Random is used as
+# is, so that a population can be recreated exactly. If asArrays is True, the
+# population is returned as a VectorEngine.Population instead of a 2D list.
+
+def population(numPop, infecRate, vaccRate, rng=None, asArrays=False):
+    if rng is None:
+        rng=random
+    elif not isinstance(rng, random.Random):
+        rng=random.Random(rng)
+        
+    #store each characteristic in its own list first
+    xs=[]
+    ys=[]
+    dxs=[]
+    dys=[]
     #set parameters
     for i in range(numPop):
         #set x and y coordinates
-        x=random.random()*500
-        y=random.uniform(20, 512)
+        xs+=[rng.random()*500]
+        ys+=[rng.uniform(20, 512)]
         #calculate trajectory
-        angle=random.uniform(0, 2*math.pi)
-        dx=math.cos(angle)
-        dy=math.sin(angle)
-        #intialize infected to False
-        infected=False
-        #initialize infection length to zero
-        timeSinceInfection=0
-        #intialize vaccination to False
-        vaccStatus=False
-        #no members start immune
-        immune=False
-
-        #create 2D list of members of the population
-        members+=[[x, y, dx, dy, infected, timeSinceInfection, \
-                   vaccStatus, immune]]  
+        angle=rng.uniform(0, 2*math.pi)
+        dxs+=[math.cos(angle)]
+        dys+=[math.sin(angle)]
+    #intialize infected and vaccination to False
+    infected=[False]*numPop
+    vaccStatus=[False]*numPop
     
     #set the right amount of members infected and vaccinated based
     #on infecRate and vaccRate   
     
     #infecRate is taken in as a decimal, so multiply by numPop to find how 
     #many members should be infected
-    infecRate=int(infecRate*numPop)
+    infecRate=min(int(infecRate*numPop), numPop)
     #vaccRate is taken in as a whole number, so divide by 100 before multiplying
-    vaccRate=int((vaccRate/100)*numPop)
-    numInfected=0
-    numVaccinated=0
-    #when the number of infected members is less than it should be 
-    #(based on the rate), randomly assign members to be infected
-    while numInfected!=infecRate:
-        infecMember=random.choice(members)
-        infecMember[4]=True
-        numInfected=0
-        #count how many members are infected
-        for x in members:
-            if x[4]:
-                numInfected+=1
-    #when the number of vaccinated members is less than it should be 
-    #(based on the rate), randomly assign members to be vaccinated    
-    while numVaccinated!=vaccRate:
-        vaccMember=random.choice(members)
-        vaccMember[6]=True
-        numVaccinated=0
-        #count how many members are vaccinated
-        for x in members:
-            if x[6]:
-                numVaccinated+=1
+    vaccRate=min(int((vaccRate/100)*numPop), numPop)
+    #pick which members are infected and vaccinated, without picking the same
+    #member twice
+    for i in rng.sample(range(numPop), infecRate):
+        infected[i]=True
+    for i in rng.sample(range(numPop), vaccRate):
+        vaccStatus[i]=True
+    
+    #initialize infection length to zero, and no members start immune
+    if asArrays:
+        import VectorEngine
+        return VectorEngine.Population(xs, ys, dxs, dys, infected, \
+                                       [0.0]*numPop, vaccStatus, \
+                                       [False]*numPop)
+    
+    #create 2D list of members of the population
+    members=[]
+    for i in range(numPop):
+        members+=[[xs[i], ys[i], dxs[i], dys[i], infected[i], 0, \
+                   vaccStatus[i], False]]
     return members
 
 # drawKey() is a template for drawing the color coded squares that make up
@@ -250,9 +265,6 @@ def drawPeople(members):
                 else:
                     Draw.setColor(Draw.RED)
                     Draw.filledOval(p[0], p[1], 10, 10) 
-                #increment timeSinceInfection by 0.5 each loop 
-                #because in each loop, the time increases by 0.5 hours
-                p[5]+=0.5
             #if member not infected
             else:
                 #if immune, represent as purple circle
@@ -264,6 +276,16 @@ def drawPeople(members):
                     Draw.setColor(Draw.GREEN)
                     Draw.filledOval(p[0], p[1], 10, 10)                     
 
+# advanceInfection() increments timeSinceInfection of every infected member
+# by 0.5, because in each loop, the time increases by 0.5 hours. This used to
+# happen in drawPeople(), so that the simulation could not run without 
+# drawing the members.
+
+def advanceInfection(members):
+    for p in members:
+        if p[4]:
+            p[5]+=0.5
+
 # movePeople() moves the members by their trajectories and accounts for
 # reflecting off the side of the box.
 
@@ -292,31 +314,62 @@ def movePeople(members):
             p[1]+=1
             p[3]*=-1     
 
+# findContacts() finds which members are in contact with one another without
+# comparing every pair of members. The box is divided into square cells as
+# wide as the contact distance, and each member is put in the cell that holds
+# its position. Two members can then only be in contact if they are in the
+# same cell or in neighboring cells, so each member is only compared with
+# the members of 5 cells (its own cell, and the cells to the right, below 
+# right, below, and above right, so each pair of cells is only checked once).
+# Returns a 2D list of the members in contact, sorted by the first and then 
+# the second member.
+
+def findContacts(members):
+    #distance between the centers of two members for them to be in contact
+    contact=10+0.0001
+    
+    #put each member in its cell
+    cells={}
+    for row in range(len(members)):
+        cell=(int(members[row][0]//contact), int(members[row][1]//contact))
+        if cell in cells:
+            cells[cell]+=[row]
+        else:
+            cells[cell]=[row]
+    
+    contacts=[]
+    for (cellX, cellY), rows in cells.items():
+        for nextX, nextY in ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1)):
+            others=cells.get((cellX+nextX, cellY+nextY))
+            if others is None:
+                continue
+            for a in range(len(rows)):
+                x1=members[rows[a]][0]
+                y1=members[rows[a]][1]
+                #within the same cell, only compare with later members
+                start=a+1 if nextX==0 and nextY==0 else 0
+                for b in range(start, len(others)):
+                    x2=members[others[b]][0]
+                    y2=members[others[b]][1]
+                    #use Euclidian distance to check if in contact
+                    if (x2-x1)**2+(y2-y1)**2<=contact**2:
+                        contacts+=[[min(rows[a], others[b]), \
+                                    max(rows[a], others[b])]]
+    contacts.sort()
+    return contacts
+
 # checkCollisions() checks whether any members came in contact with one another.
 # If they did, store in a 2D list to be dealt with later and display elastic
-# collision between the two members.
+# collision between the two members. Raises an ImportError if the
+# ElasticCollision module is not installed.
 
 def checkCollisions(members):
-    #initalize local variables
-    collisions=[]
-    x=0
-    y=0
-    
-    #loop through members
-    for row in range(len(members)):
-        #store center x coordinate in x1
-        x1=members[row][0]+10
-        #store center y coordinate in y1
-        y1=members[row][1]+10
-        for i in range(row+1, len(members)):
-            #find center of each circle
-            x2 = members[i][0]+10
-            y2 = members[i][1]+10
-            #use Euclidian distance to check if two members are in contact
-            if abs(math.sqrt((x2-x1)**2+(y2-y1)**2))<=10+0.0001:
-                #collisions is a 2D list of members that collided
-                collisions+=[[row,i]]
-                ElasticCollision.collide(members[row], members[i])
+    if ElasticCollision is None:
+        raise ImportError("the list model needs ElasticCollision")
+    #find the members in contact, in the same order as comparing every pair
+    collisions=findContacts(members)
+    for row, i in collisions:
+        ElasticCollision.collide(members[row], members[i])
 
     return collisions
 
@@ -452,8 +505,7 @@ def setParameters(members, infecRate, numPop, vaccRate, vaccEffective, \
             #of the buttons that adjust parameters, and adjusts the respective
             #parameter. Each parameter has an upper and lower bound. None of
             #them can be negative, no rates can be higher than 1 (aka 100%), and
-            #due to limitations on the use of the ElasticCollisions code that
-            #is used, the population size (numPop) cannot be greater than 120.
+            #the population size (numPop) cannot be greater than maxPop.
             if newX>=522 and newX<=536:
                 #infecRate must be a whole number to start,
                 #because there can't be a fraction of a person infected,
@@ -461,7 +513,7 @@ def setParameters(members, infecRate, numPop, vaccRate, vaccEffective, \
                     infecRate+=.01
                 elif newY>=36 and newY<=50 and infecRate-.01>=0:
                     infecRate-=.01              
-                elif newY>=56 and newY<=70 and numPop<120:
+                elif newY>=56 and newY<=70 and numPop<maxPop:
                     numPop+=1
                 elif newY>=76 and newY<=90 and numPop>0:
                         numPop-=1 
@@ -511,6 +563,28 @@ def countHealthy(members):
     #return values in a tuple
     return healthy, infecRate
 
+# countStates() counts how many members are drawn in each color by 
+# drawPeople(). Returns a tuple of the number of members who are contagious 
+# (red), infected but not contagious (orange), healthy (green), and immune
+# (purple).
+
+def countStates(members):
+    contagious=0
+    incubating=0
+    healthy=0
+    immune=0
+    for p in members:
+        if p[4]:
+            if p[5]<=240:
+                incubating+=1
+            else:
+                contagious+=1
+        elif p[7]:
+            immune+=1
+        else:
+            healthy+=1
+    return contagious, incubating, healthy, immune
+
 # time() keeps track of the time since the start of the simulation. Each loop
 # represents 0.5 hours, and 24 hours make up one day. Time returns a tuple
 # with the updated time.
@@ -524,12 +598,11 @@ def time(day, hour):
     hour+=0.5 
     return day, hour
 
-# main() executes the functions in the correct manner to run the simulation.
-
-def main():
-    #set canvas size
-    Draw.setCanvasSize(900, 512)       
+# chooseParameters() sets the simulation parameters to their defaults and
+# lets the user modify them with setParameters() until they press START.
+# Returns a tuple of the population and the chosen parameters.
 
+def chooseParameters():
     #initialize parameters to default
     numPop=100
     infecRate=0.50
@@ -543,10 +616,6 @@ def main():
     #initialize the population
     members=population(numPop, infecRate, vaccRate)
     
-    #set time to 0 days, 0 hours
-    day=0
-    hour=0  
-    
     #before user presses START, allow modification of simulation parameters
     start=False
     while not start:
@@ -555,6 +624,22 @@ def main():
         members, infecRate, numPop, vaccRate, vaccEffective, immunityRate,\
         transmissionRate, start=setParameters(members, infecRate, \
         numPop, vaccRate, vaccEffective, immunityRate, transmissionRate, start)
+    return members, infecRate, numPop, vaccRate, vaccEffective, \
+           immunityRate, transmissionRate, deathRate
+
+# main() executes the functions in the correct manner to run the simulation.
+
+def main():
+    #set canvas size
+    Draw.setCanvasSize(900, 512)       
+
+    #let the user choose the parameters and initialize the population
+    members, infecRate, numPop, vaccRate, vaccEffective, immunityRate, \
+    transmissionRate, deathRate=chooseParameters()
+    
+    #set time to 0 days, 0 hours
+    day=0
+    hour=0  
     
     # While their are members alive and there are members who are infected,
     # run the simulation
@@ -573,6 +658,9 @@ def main():
         #draw the members of the population
         drawPeople(members)
         
+        #advance the infection of the infected members
+        advanceInfection(members)
+        
         #animate the population
         movePeople(members)
         
@@ -595,4 +683,5 @@ def main():
     #display closing page
     closingPage(day, hour)
 
-main()
\ No newline at end of file
+if __name__=="__main__":
+    main()
@@ -0,0 +1,299 @@
+# DomainDecomposition.py runs one large simulation on several CPU cores. The
+# box is cut into vertical strips (tiles), one per worker process, and each
+# worker simulates the members in its own tile. The arrays of the population
+# are kept in shared memory, which every worker can read and write, so no
+# member data has to be sent between processes; the workers only send each
+# other the indices of members.
+
+# In each loop, every worker:
+#   1. advances the infections and moves the members it owns,
+#   2. hands the members that left its tile to the neighboring tile,
+#   3. sends each neighbor its members within twice the contact distance of
+#      the edge between them (the ghosts),
+#   4. finds the contacts among its own members and the ghosts, bounces them,
+#      and decides which of its own members are infected, and
+#   5. decides which of its own infected members die or recover.
+# A worker only ever changes its own members. Pairs of members on both sides
+# of an edge are bounced by both workers, each changing its own member. The
+# virus can only spread to a member in the worker that owns it, so each
+# chance of infection is only taken once.
+
+# Members are bounced with VectorEngine.bounceLocal() rather than in rounds
+# like a single process does. A bounce in rounds depends on the order of
+# every pair in a group of members in contact with each other, and in a
+# crowded box such a group can hold nearly every member, so each worker
+# would need the whole box. With bounceLocal() the bounce of a member only
+# depends on the members within twice the contact distance of it, which the
+# ghosts are. Two members only in contact with each other bounce the same
+# either way, but a member moving towards several others in the same loop
+# only bounces off one of them per loop, so the run drifts apart from
+# Headless.runHeadless() unless both use keyed=True. Members stay in contact
+# for longer this way, so there are more contacts per loop than with bounces
+# in rounds (see VectorEngine.step()). So that the ghosts all come from the
+# neighboring tiles, a tile must be at least twice as wide as the contact
+# distance, which limits the number of tiles to MAX_TILES.
+
+# Infections end with VectorEngine.updateInfec(ordered=False), since the
+# order of the members of a tile has no meaning. By default each worker has
+# its own random number stream, so results depend on the number of workers.
+# With keyed=True, every worker draws from a CounterRNG.KeyedRandom with the
+# same seed, and the results are exactly those of Headless.runHeadless() with
+# keyed=True, whatever the number of workers: the random numbers only depend
+# on the ids of the members, and the bounces and infections of a member only
+# on the members that are in its own tile or are ghosts.
+
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+import Covid19Simulation
+import CounterRNG
+import VectorEngine
+
+#arrays kept in shared memory: those of a Population, and whether each
+#member is still alive
+FIELDS=VectorEngine.FIELDS+("alive",)
+#width of the box that is cut into tiles
+WIDTH=512
+#most tiles the box can be cut into
+MAX_TILES=int(WIDTH//(2*VectorEngine.CONTACT))
+
+# shareArrays() copies the arrays of pop into new blocks of shared memory.
+# Returns the blocks, and a description of them that can be sent to other
+# processes and passed to attachArrays().
+
+def shareArrays(pop):
+    blocks={}
+    spec={}
+    for name in FIELDS:
+        array=getattr(pop, name) if name!="alive" else \
+              np.ones(len(pop), dtype=bool)
+        block=shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        np.ndarray(array.shape, array.dtype, buffer=block.buf)[:]=array
+        blocks[name]=block
+        spec[name]=(block.name, array.dtype.str, len(array))
+    return blocks, spec
+
+# attachArrays() opens the shared memory described by spec. Returns the
+# blocks, which must be kept open while the arrays are used, and a
+# dictionary of arrays backed by them.
+
+def attachArrays(spec):
+    blocks={}
+    arrays={}
+    for name, (blockName, dtype, length) in spec.items():
+        blocks[name]=shared_memory.SharedMemory(name=blockName)
+        arrays[name]=np.ndarray((length,), np.dtype(dtype), \
+                                buffer=blocks[name].buf)
+    return blocks, arrays
+
+# tileEdges() returns the left edges of tiles tiles of the box, followed by
+# the right edge of the last one. The first and last tiles reach forever, so
+# that every member belongs to a tile.
+
+def tileEdges(tiles):
+    edges=np.linspace(0, WIDTH, tiles+1)
+    edges[0]=-np.inf
+    edges[-1]=np.inf
+    return edges
+
+# gather() returns a Population holding copies of the members at indices.
+
+def gather(arrays, indices):
+    return VectorEngine.Population(*[arrays[name][indices] for name in \
+                                     VectorEngine.FIELDS])
+
+# scatter() writes the arrays named names of local back to the members at
+# indices, taking the first len(indices) members of local.
+
+def scatter(arrays, indices, local, names):
+    for name in names:
+        arrays[name][indices]=getattr(local, name)[:len(indices)]
+
+# Mail sends arrays of indices between neighboring workers. Messages carry
+# a label, so that a worker that gets a message meant for a later step
+# keeps it until it gets there.
+
+class Mail:
+    def __init__(self, tile, inboxes):
+        self.tile=tile
+        self.inboxes=inboxes
+        self.early={}
+        self.neighbors=[other for other in (tile-1, tile+1) \
+                        if 0<=other<len(inboxes)]
+
+    # exchange() sends data[neighbor] to each neighbor and returns a
+    # dictionary of what each neighbor sent back, for the step label.
+
+    def exchange(self, label, data):
+        for neighbor in self.neighbors:
+            self.inboxes[neighbor].put((label, self.tile, data[neighbor]))
+        received={}
+        for neighbor in self.neighbors:
+            if (label, neighbor) in self.early:
+                received[neighbor]=self.early.pop((label, neighbor))
+        while len(received)<len(self.neighbors):
+            got, sender, payload=self.inboxes[self.tile].get()
+            if got==label:
+                received[sender]=payload
+            else:
+                self.early[(got, sender)]=payload
+        return received
+
+# worker() simulates the tile between edges[tile] and edges[tile+1], which
+# starts out owning the members at owned, until told to stop. Each loop is
+# started by a message on commands, and ends by putting the counts of the
+# tile on results.
+
+def worker(tile, edges, spec, owned, inboxes, commands, results, barrier, \
+           params, seed, keyed):
+    blocks, arrays=attachArrays(spec)
+    mail=Mail(tile, inboxes)
+    rng=CounterRNG.KeyedRandom(seed) if keyed else np.random.default_rng(seed)
+    left=edges[tile]
+    right=edges[tile+1]
+    contact=VectorEngine.CONTACT
+    loop=0
+    while commands.get():
+        #move the members of the tile
+        local=gather(arrays, owned)
+        VectorEngine.advanceInfection(local)
+        VectorEngine.movePeople(local)
+        scatter(arrays, owned, local, ("x", "y", "dx", "dy", \
+                                       "timeSinceInfection"))
+
+        #hand members that left the tile to the neighbors
+        x=local.x
+        leaving={tile-1: owned[x<left], tile+1: owned[x>=right]}
+        arrived=mail.exchange((loop, "migrate"), leaving)
+        owned=np.sort(np.concatenate([owned[(x>=left) & (x<right)]]+ \
+                                     list(arrived.values())))
+
+        #send the members near each edge to the neighbor on that side
+        x=arrays["x"][owned]
+        near={tile-1: owned[x<left+2*contact], \
+              tile+1: owned[x>=right-2*contact]}
+        ghosts=mail.exchange((loop, "ghosts"), near)
+        ghosts=np.concatenate(list(ghosts.values())) if ghosts else \
+               np.empty(0, np.int64)
+
+        #bounce and infect using the members of the tile and the ghosts, in
+        #order of id like a single process
+        members=np.concatenate((owned, ghosts))
+        order=np.argsort(members, kind="stable")
+        members=members[order]
+        mine=order<len(owned)
+        local=gather(arrays, members)
+        rows, cols=VectorEngine.checkCollisions(local, local=True)
+        if keyed:
+            uniforms=rng.uniform(CounterRNG.TRANSMIT, local.ids[rows], \
+                                 local.ids[cols])
+        else:
+            uniforms=rng.random(len(rows))
+        infected, attempts=VectorEngine.transmit( \
+            rows, cols, local.infected, local.timeSinceInfection, \
+            local.immune, local.vaccStatus, params["transmissionRate"]/100, \
+            params["vaccEffective"]/100, uniforms)
+        infected=infected[mine[infected]]
+        local.infected[infected]=True
+        #wait until every worker has read its ghosts before changing members
+        barrier.wait()
+        for name in ("dx", "dy", "infected"):
+            arrays[name][members[mine]]=getattr(local, name)[mine]
+
+        #decide which infected members die or recover
+        local=gather(arrays, owned)
+        tally={}
+        VectorEngine.updateInfec(local, params["deathRate"], \
+                                 params["immunityRate"], rng, tally, \
+                                 ordered=False)
+        survived=np.isin(arrays["ids"][owned], local.ids)
+        arrays["alive"][owned[~survived]]=False
+        owned=owned[survived]
+        scatter(arrays, owned, local, ("infected", "timeSinceInfection", \
+                                       "immune"))
+
+        healthy, infecRate=VectorEngine.countHealthy(local)
+        results.put((tile, len(owned), healthy, \
+                     int(np.count_nonzero(local.immune)), len(infected), \
+                     tally["deaths"], len(rows)))
+        loop+=1
+        if keyed:
+            rng.tick+=1
+    for block in blocks.values():
+        block.close()
+
+# runDecomposed() runs the simulation on pop, split into tiles tiles each run
+# by its own worker process, until no members are infected, all members have
+# died, or maxLoops loops have run. By default there is one tile per CPU, up
+# to MAX_TILES; asking for more than MAX_TILES raises a ValueError. params
+# holds the rates of Headless.runHeadless(). With keyed=True, the random
+# numbers are keyed by seed, member id, loop, and purpose (see CounterRNG.py).
+# Returns a tuple of the final day and hour, the final population, and a
+# dictionary of time series like runHeadless().
+
+def runDecomposed(pop, params, tiles=None, seed=None, maxLoops=None, \
+                  keyed=False):
+    if tiles is None:
+        tiles=min(mp.cpu_count(), MAX_TILES)
+    elif not 1<=tiles<=MAX_TILES:
+        raise ValueError("tiles must be between 1 and "+str(MAX_TILES)+ \
+                         ", not "+str(tiles))
+    edges=tileEdges(tiles)
+    blocks, spec=shareArrays(pop)
+    context=mp.get_context()
+    inboxes=[context.Queue() for tile in range(tiles)]
+    commands=[context.Queue() for tile in range(tiles)]
+    results=context.Queue()
+    barrier=context.Barrier(tiles)
+    if keyed:
+        seeds=[CounterRNG.KeyedRandom(seed).key]*tiles
+    else:
+        seeds=np.random.SeedSequence(seed).spawn(tiles)
+    tileOf=np.searchsorted(edges, pop.x, side="right")-1
+    workers=[context.Process(target=worker, args=(tile, edges, spec, \
+             np.flatnonzero(tileOf==tile), inboxes, commands[tile], results, \
+             barrier, params, seeds[tile], keyed), daemon=True) \
+             for tile in range(tiles)]
+    try:
+        for process in workers:
+            process.start()
+        startPop=numPop=len(pop)
+        healthy=0
+        day=0
+        hour=0
+        loops=0
+        series={"healthy": [], "infected": [], "immune": [], "dead": [], \
+                "numPop": []}
+        while numPop>0 and healthy!=numPop:
+            if maxLoops is not None and loops>=maxLoops:
+                break
+            day, hour=Covid19Simulation.time(day, hour)
+            for queue in commands:
+                queue.put(True)
+            counts=np.array([results.get()[1:] for tile in range(tiles)]) \
+                   .sum(axis=0)
+            numPop, healthy, immune=int(counts[0]), int(counts[1]), \
+                                    int(counts[2])
+            series["healthy"].append(healthy)
+            series["infected"].append(numPop-healthy)
+            series["immune"].append(immune)
+            series["dead"].append(startPop-numPop)
+            series["numPop"].append(numPop)
+            loops+=1
+        for queue in commands:
+            queue.put(False)
+        for process in workers:
+            process.join()
+
+        arrays={name: np.ndarray((spec[name][2],), np.dtype(spec[name][1]), \
+                                 buffer=blocks[name].buf) for name in FIELDS}
+        final=gather(arrays, np.flatnonzero(arrays["alive"]))
+        del arrays
+    finally:
+        for process in workers:
+            if process.is_alive():
+                process.terminate()
+        for block in blocks.values():
+            block.close()
+            block.unlink()
+    return day, hour, final, series
@@ -0,0 +1,278 @@
+# Ensemble.py runs many replicates of the simulation with the same parameters
+# on a pool of worker processes. A single run of the simulation is random, so
+# the results of many runs are combined into an average curve, and quantiles
+# showing how far the runs spread around it.
+
+# Every replicate gets its own random number stream, spawned from one seed,
+# so the ensemble is reproducible and the results do not depend on how many
+# workers there are or which worker runs which replicate.
+
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import math
+import os
+import numpy as np
+import Headless
+
+#time series combined across the replicates
+METRICS=("infected", "immune", "healthy", "dead")
+
+# replicateSeeds() returns one independent seed for each of the replicates,
+# spawned from seed.
+
+def replicateSeeds(seed, replicates):
+    return np.random.SeedSequence(seed).spawn(replicates)
+
+# runReplicate() runs one headless simulation and returns only its time
+# series, which is all that has to be sent back from the worker process.
+
+def runReplicate(params, seed, maxLoops=None):
+    day, hour, pop, series=Headless.runHeadless(seed=seed, \
+                                                maxLoops=maxLoops, **params)
+    return {name: series[name] for name in METRICS}
+
+# stack() puts one time series of every replicate in a 2D array, with one row
+# per replicate. Replicates that finished early keep their final value until
+# the end of the longest replicate, since nothing changes after a simulation
+# ends.
+
+def stack(runs, name):
+    length=max(len(run[name]) for run in runs)
+    table=np.zeros((len(runs), length))
+    for row, run in enumerate(runs):
+        values=run[name]
+        if values:
+            table[row, :len(values)]=values
+            table[row, len(values):]=values[-1]
+    return table
+
+# aggregate() combines the time series of several replicates. Returns a
+# dictionary holding, for each metric, a dictionary with the mean across
+# replicates at each loop ("mean") and a 2D array with one row per quantile
+# ("quantiles"), as well as the quantiles used and the number of loops
+# each replicate ran ("loops").
+
+def aggregate(runs, quantiles=(0.05, 0.5, 0.95)):
+    result={"quantiles": tuple(quantiles), \
+            "loops": np.array([len(run[METRICS[0]]) for run in runs])}
+    for name in METRICS:
+        table=stack(runs, name)
+        result[name]={"mean": table.mean(axis=0), \
+                      "quantiles": np.quantile(table, quantiles, axis=0)}
+    return result
+
+# runEnsemble() runs replicates simulations with the parameters in params,
+# which are passed to Headless.runHeadless() (for example numPop=500 or
+# transmissionRate=20.0), on a pool of worker processes (one per CPU core
+# by default). Returns the result of aggregate().
+
+def runEnsemble(replicates, seed=None, workers=None, maxLoops=None, \
+                quantiles=(0.05, 0.5, 0.95), **params):
+    seeds=replicateSeeds(seed, replicates)
+    if workers is None:
+        workers=os.cpu_count() or 1
+    #hand out several replicates at a time to keep the workers busy
+    chunk=max(1, replicates//(4*workers))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        runs=list(pool.map(runReplicate, [params]*replicates, seeds, \
+                           [maxLoops]*replicates, chunksize=chunk))
+    return aggregate(runs, quantiles)
+
+# The functions below run an ensemble without keeping every replicate. Each
+# replicate's time series are folded into running statistics as soon as it
+# finishes, and new replicates are only started until the targets (peak
+# number infected, final fraction immune, total deaths, and the duration
+# shown by closingPage()) are known closely enough, so the number of
+# replicates does not have to be guessed beforehand.
+
+#targets that decide when a streaming ensemble can stop
+TARGETS=("peakInfected", "finalImmune", "deaths", "duration")
+#z value of a two-sided 95% confidence interval
+Z95=1.959964
+
+# RunningCurves keeps the running mean and variance (with Welford's method)
+# and a histogram of one time series at every loop, across replicates.
+# Replicates that finished early keep their final value, like in stack(), so
+# when a longer replicate arrives, the new loops start from the statistics
+# of the final values of the replicates before it. Values are counts between
+# 0 and top, and the histograms have bins equal bins, from which quantiles
+# are estimated to within a bin.
+
+class RunningCurves:
+    def __init__(self, top, bins=64):
+        self.width=max(1, -(-(int(top)+1)//bins))
+        self.bins=-(-(int(top)+1)//self.width)
+        self.count=0
+        self.mean=np.zeros(0)
+        self.m2=np.zeros(0)
+        self.histogram=np.zeros((0, self.bins), dtype=np.int64)
+        #the same statistics of the final values
+        self.finalMean=0.0
+        self.finalM2=0.0
+        self.finalHistogram=np.zeros(self.bins, dtype=np.int64)
+
+    # add() folds the time series values of one replicate in.
+
+    def add(self, values):
+        values=np.asarray(values, dtype=np.float64)
+        if len(values)==0:
+            values=np.zeros(1)
+        if len(values)>len(self.mean):
+            extra=len(values)-len(self.mean)
+            self.mean=np.concatenate((self.mean, \
+                                      np.full(extra, self.finalMean)))
+            self.m2=np.concatenate((self.m2, np.full(extra, self.finalM2)))
+            self.histogram=np.concatenate((self.histogram, \
+                np.tile(self.finalHistogram, (extra, 1))))
+        padded=np.full(len(self.mean), values[-1])
+        padded[:len(values)]=values
+
+        self.count+=1
+        delta=padded-self.mean
+        self.mean+=delta/self.count
+        self.m2+=delta*(padded-self.mean)
+        bins=np.minimum((padded//self.width).astype(np.int64), self.bins-1)
+        self.histogram[np.arange(len(padded)), bins]+=1
+
+        delta=values[-1]-self.finalMean
+        self.finalMean+=delta/self.count
+        self.finalM2+=delta*(values[-1]-self.finalMean)
+        self.finalHistogram[min(int(values[-1]//self.width), self.bins-1)]+=1
+
+    # variance() returns the sample variance at every loop.
+
+    def variance(self):
+        if self.count<2:
+            return np.zeros(len(self.mean))
+        return self.m2/(self.count-1)
+
+    # quantiles() returns a 2D array with one row per quantile, estimated
+    # from the histograms by interpolating within the bin it falls in.
+
+    def quantiles(self, quantiles):
+        cumulative=np.cumsum(self.histogram, axis=1)
+        result=np.zeros((len(quantiles), len(self.mean)))
+        loops=np.arange(len(self.mean))
+        for row, q in enumerate(quantiles):
+            rank=q*self.count
+            bins=np.minimum((cumulative<rank).sum(axis=1), self.bins-1)
+            below=np.where(bins>0, cumulative[loops, bins-1], 0)
+            inBin=np.maximum(self.histogram[loops, bins], 1)
+            within=np.clip((rank-below)/inBin, 0, 1)
+            result[row]=(bins+within)*self.width
+        return result
+
+# RunningScalars keeps the running mean and variance of a few numbers, one
+# value of each per replicate.
+
+class RunningScalars:
+    def __init__(self, names):
+        self.count=0
+        self.mean=dict.fromkeys(names, 0.0)
+        self.m2=dict.fromkeys(names, 0.0)
+
+    def add(self, values):
+        self.count+=1
+        for name in self.mean:
+            delta=values[name]-self.mean[name]
+            self.mean[name]+=delta/self.count
+            self.m2[name]+=delta*(values[name]-self.mean[name])
+
+    # halfWidth() returns half the width of the 95% confidence interval of
+    # the mean of name.
+
+    def halfWidth(self, name):
+        if self.count<2:
+            return float("inf")
+        return Z95*math.sqrt(self.m2[name]/(self.count-1)/self.count)
+
+# runTargets() runs one replicate like runReplicate(), and also returns the
+# values of the targets it reached.
+
+def runTargets(params, seed, maxLoops=None):
+    day, hour, pop, series=Headless.runHeadless(seed=seed, \
+                                                maxLoops=maxLoops, **params)
+    #100 members is the default of runHeadless()
+    numPop=params.get("numPop", 100)
+    targets={"peakInfected": max(series["infected"], default=0), \
+             "finalImmune": series["immune"][-1]/numPop \
+                            if series["immune"] else 0.0, \
+             "deaths": series["dead"][-1] if series["dead"] else 0, \
+             "duration": day+hour/24}
+    return {name: series[name] for name in METRICS}, targets
+
+# converged() returns whether the confidence interval of every target in
+# tolerance is narrower than tolerance[name] times the size of its mean.
+
+def converged(scalars, tolerance):
+    return all(scalars.halfWidth(name)<=tol*abs(scalars.mean[name]) \
+               for name, tol in tolerance.items())
+
+# runStreaming() runs replicates with the parameters in params, like
+# runEnsemble(), one replicate after another until the 95% confidence
+# interval of the mean of every target is within tolerance of it (a fraction
+# of the mean; a number applies to every target in TARGETS, a dictionary
+# only to the targets it names), after at least minReplicates and at most
+# maxReplicates replicates. Replicates are folded in replicate order, and
+# replicate r has the same seed as in runEnsemble(), so the result does not
+# depend on the number of workers. Returns a dictionary like aggregate(),
+# with "std" as well as "mean" for each metric, the number of replicates
+# folded in ("replicates"), the mean and half width of each target
+# ("targets"), and whether every target converged ("converged").
+
+def runStreaming(tolerance=0.05, minReplicates=10, maxReplicates=1000, \
+                 seed=None, workers=None, maxLoops=None, \
+                 quantiles=(0.05, 0.5, 0.95), bins=64, **params):
+    if not isinstance(tolerance, dict):
+        tolerance=dict.fromkeys(TARGETS, tolerance)
+    root=np.random.SeedSequence(seed)
+    if workers is None:
+        workers=os.cpu_count() or 1
+    curves={name: RunningCurves(params.get("numPop", 100), bins) \
+            for name in METRICS}
+    scalars=RunningScalars(TARGETS)
+    loops=[]
+    finished={}
+    launched=0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        running={}
+        while True:
+            #keep every worker busy with the next replicates
+            while len(running)<workers and launched<maxReplicates:
+                stream=np.random.SeedSequence(root.entropy, \
+                                              spawn_key=(launched,))
+                running[pool.submit(runTargets, params, stream, maxLoops)]= \
+                    launched
+                launched+=1
+            if not running:
+                break
+            done, pending=wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                finished[running.pop(future)]=future.result()
+            #fold in the replicates that are next in order
+            stop=False
+            while scalars.count in finished:
+                series, targets=finished.pop(scalars.count)
+                for name in METRICS:
+                    curves[name].add(series[name])
+                scalars.add(targets)
+                loops.append(len(series[METRICS[0]]))
+                if scalars.count>=minReplicates and \
+                   converged(scalars, tolerance):
+                    stop=True
+                    break
+            if stop or scalars.count>=maxReplicates:
+                for future in running:
+                    future.cancel()
+                break
+
+    result={"quantiles": tuple(quantiles), "loops": np.array(loops), \
+            "replicates": scalars.count, \
+            "converged": converged(scalars, tolerance), \
+            "targets": {name: {"mean": scalars.mean[name], \
+                               "halfWidth": scalars.halfWidth(name)} \
+                        for name in TARGETS}}
+    for name in METRICS:
+        result[name]={"mean": curves[name].mean, \
+                      "std": np.sqrt(curves[name].variance()), \
+                      "quantiles": curves[name].quantiles(quantiles)}
+    return result
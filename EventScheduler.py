@@ -0,0 +1,161 @@
+# EventScheduler.py decides when infected members die or recover without
+# looking at every member in every loop. When a member is infected, the loop
+# in which they become contagious and the loop in which their infection ends
+# are worked out straight away and put in priority queues, and each loop
+# only handles the events that are due in it.
+
+# updateInfec() in VectorEngine.py gives every member who has been infected
+# for twenty days a chance to die (x*.01<=deathRate) and otherwise a 20%
+# chance to recover, in every loop, and stops at the first member who does
+# neither, so the result depends on the order of the members. Here every
+# member gets the same chances in every loop independently of the others,
+# which means the number of loops until their infection ends follows a
+# geometric distribution. That number is drawn once, when they become
+# eligible, and the outcome (death, or recovery with or without immunity) is
+# drawn when it is due, so the result no longer depends on the order of the
+# members.
+
+# The scheduler also keeps track of which members are contagious. A
+# member's contagious event is due in the loop in which their infection
+# reaches CONTAGIOUS, and is handled at the start of that loop, before the
+# virus spreads, by updateContagious(). VectorEngine.step() passes the flags
+# it keeps to updateStatus(), instead of comparing every timeSinceInfection.
+
+import heapq
+import numpy as np
+import VectorEngine
+
+#chance of recovering in a loop for a member who does not die
+RECOVERY_CHANCE=.20
+
+# InfectionScheduler keeps the queues of events for one population: one of
+# members becoming contagious (contagiousQueue), and one of infections
+# ending (queue). Each entry of a queue is a tuple of the loop it is due in,
+# a sequence number (so entries due in the same loop are handled in the order
+# they were added), and an array of the ids of the members it applies to.
+# loop is the number of loops that have finished. contagious holds whether
+# each member of the population is contagious.
+
+class InfectionScheduler:
+    def __init__(self, pop, deathRate, immunityRate, rng, loop=0):
+        self.deathChance=min(deathRate*100, 1.0)
+        self.immunityRate=immunityRate/100
+        #chance that an infection ends in a loop once it can
+        self.endChance=self.deathChance+ \
+                       (1-self.deathChance)*RECOVERY_CHANCE
+        self.loop=loop
+        self.queue=[]
+        self.contagiousQueue=[]
+        self.count=0
+        self.contagious=pop.infected & \
+                        (pop.timeSinceInfection>=VectorEngine.CONTAGIOUS)
+        infected=np.flatnonzero(pop.infected)
+        self.schedule(pop.ids[infected], pop.timeSinceInfection[infected], \
+                      rng)
+
+    # loopsUntil() returns in how many loops a member whose infection has
+    # lasted timeSinceInfection will have lasted until threshold.
+
+    def loopsUntil(self, timeSinceInfection, threshold):
+        return np.maximum(1, np.ceil((threshold-timeSinceInfection)/0.5)) \
+               .astype(np.int64)
+
+    # push() adds events for the members ids to queue, grouping together the
+    # members due in the same loop.
+
+    def push(self, queue, due, ids):
+        order=np.argsort(due, kind="stable")
+        due=due[order]
+        ids=ids[order]
+        loops, starts=np.unique(due, return_index=True)
+        for loop, group in zip(loops.tolist(), np.split(ids, starts[1:])):
+            heapq.heappush(queue, (loop, self.count, group))
+            self.count+=1
+
+    # schedule() adds the events of members whose infections have lasted
+    # timeSinceInfection at the end of the current loop. Members who are
+    # already contagious only get the event of their infection ending.
+
+    def schedule(self, ids, timeSinceInfection, rng):
+        if len(ids)==0:
+            return
+        waiting=timeSinceInfection<VectorEngine.CONTAGIOUS
+        self.push(self.contagiousQueue, self.loop+ \
+                  self.loopsUntil(timeSinceInfection[waiting], \
+                                  VectorEngine.CONTAGIOUS), ids[waiting])
+        eligible=self.loop+self.loopsUntil(timeSinceInfection, \
+                                           VectorEngine.RECOVERY)
+        self.push(self.queue, eligible+ \
+                  rng.geometric(self.endChance, len(ids))-1, ids)
+
+    # infect() schedules the events of members who were infected in the loop
+    # that is running.
+
+    def infect(self, ids, rng):
+        #the loop that is running has not finished, so it counts as the start
+        self.loop+=1
+        self.schedule(ids, np.zeros(len(ids)), rng)
+        self.loop-=1
+
+    # due() removes the events due in or before loop from queue, and returns
+    # the ids of the members they apply to.
+
+    def due(self, queue, loop):
+        ids=[]
+        while queue and queue[0][0]<=loop:
+            ids.append(heapq.heappop(queue)[2])
+        return np.concatenate(ids) if ids else np.empty(0, np.int64)
+
+    # nextContagious() returns the loop in which the next member becomes
+    # contagious, or None if no member is waiting to.
+
+    def nextContagious(self):
+        return self.contagiousQueue[0][0] if self.contagiousQueue else None
+
+    # updateContagious() starts the loop that is running by marking the
+    # members whose contagious events are due in it (or in or before loop, if
+    # loop is given) as contagious. Returns the flags of the whole population. If
+    # tally is a dictionary, the number of members who became contagious is
+    # stored in it under "becameContagious".
+
+    def updateContagious(self, pop, tally=None, loop=None):
+        ids=self.due(self.contagiousQueue, self.loop+1 if loop is None else \
+                     loop)
+        #ids never change order, so they can be found by binary search
+        self.contagious[np.searchsorted(pop.ids, ids)]=True
+        if tally is not None:
+            tally["becameContagious"]=len(ids)
+        return self.contagious
+
+    # updateInfec() finishes the current loop by handling the infections
+    # ending in it. Members whose infection ends either die, and are removed,
+    # or recover and develop antibodies with probability immunityRate, and are
+    # no longer contagious. Returns the new population size. If tally is a
+    # dictionary, the number of deaths and recoveries are stored in it under
+    # "deaths" and "recoveries".
+
+    def updateInfec(self, pop, rng, tally=None):
+        self.loop+=1
+        members=np.searchsorted(pop.ids, self.due(self.queue, self.loop))
+
+        dies=rng.random(len(members))< \
+             self.deathChance/self.endChance
+        #a member who does not die drew x above the death chance, and only
+        #develops antibodies if x is below immunityRate, like updateInfec()
+        recovered=members[~dies]
+        x=rng.uniform(self.deathChance, 1, len(recovered))
+        pop.immune[recovered[x<=self.immunityRate]]=True
+        pop.infected[recovered]=False
+        pop.timeSinceInfection[recovered]=0
+        self.contagious[recovered]=False
+
+        deaths=int(np.count_nonzero(dies))
+        if deaths:
+            alive=np.ones(len(pop), dtype=bool)
+            alive[members[dies]]=False
+            pop.keep(alive)
+            self.contagious=self.contagious[alive]
+        if tally is not None:
+            tally["deaths"]=deaths
+            tally["recoveries"]=len(recovered)
+        return len(pop)
@@ -0,0 +1,176 @@
+# Headless.py runs the simulation without drawing anything, so that it can
+# run on computers without a display and as fast as the CPU allows. The
+# loop is the same as in main() in Covid19Simulation.py, without the calls
+# to Draw.
+
+# By default the array version of the model in VectorEngine.py is used. The
+# list version in Covid19Simulation.py can be used instead by passing
+# engine="list", which needs the ElasticCollision module but not Draw.
+
+import random
+import numpy as np
+import Covid19Simulation as sim
+import VectorEngine
+import CounterRNG
+import Checkpoint
+import EventScheduler
+
+# runHeadless() runs one simulation with the given parameters until no
+# members are infected or all members have died, or until maxLoops loops have
+# run. The parameters have the same meaning and defaults as in main().
+# seed makes the run reproducible; with no seed every run is different.
+# Returns a tuple of the final day and hour, the final population (a
+# VectorEngine.Population, or a 2D list of members for engine="list"), and a
+# dictionary with the time series of the run, holding one entry per loop for
+# the number of healthy, infected, immune, and dead members, and members alive.
+# If recorder is a TimeSeries.SeriesRecorder, a row is appended to it after
+# every loop. For long runs keepSeries=False stops the time series from being
+# kept in memory, and None is returned in its place.
+# With checkpointEvery set, a checkpoint of the whole simulation is saved
+# every checkpointEvery loops to checkpointPath, in which "{loop}" is
+# replaced by the loop number (see Checkpoint.py). Only the vector engine can
+# save checkpoints. hooks is passed to VectorEngine.step() to watch each stage
+# of every loop (see Instrumentation.py). With events=True, the vector engine
+# uses an EventScheduler.InfectionScheduler to decide when infections end,
+# which does not depend on the order of the members. With keyed=True, the
+# vector engine draws its random numbers from a CounterRNG.KeyedRandom and
+# bounces members like DomainDecomposition.py does, so the run gives exactly
+# the same results as DomainDecomposition.py with the same seed and
+# keyed=True. That bounce gives about a third more contacts per loop than
+# the default one (see VectorEngine.step()), so keyed runs check parallel
+# runs against each other, not against the default model.
+
+def runHeadless(numPop=100, infecRate=0.50, vaccRate=10.0, vaccEffective=50.0, \
+                immunityRate=50.0, transmissionRate=10.0, deathRate=0.00026, \
+                seed=None, maxLoops=None, engine="vector", recorder=None, \
+                keepSeries=True, checkpointEvery=None, \
+                checkpointPath="checkpoint-{loop}.c19", hooks=None, \
+                events=False, keyed=False):
+    params={"numPop": numPop, "infecRate": infecRate, "vaccRate": vaccRate, \
+            "vaccEffective": vaccEffective, "immunityRate": immunityRate, \
+            "transmissionRate": transmissionRate, "deathRate": deathRate}
+    if engine=="vector":
+        if keyed and events:
+            raise ValueError("scheduled events cannot use keyed random "+ \
+                             "numbers")
+        rng=CounterRNG.KeyedRandom(seed) if keyed else \
+            np.random.default_rng(seed)
+        pop=VectorEngine.population(numPop, infecRate, vaccRate, rng)
+        scheduler=None
+        if events:
+            scheduler=EventScheduler.InfectionScheduler(pop, deathRate, \
+                                                        immunityRate, rng)
+        return runVector(pop, rng, 0, 0, 0, params, maxLoops, recorder, \
+                         keepSeries, checkpointEvery, checkpointPath, hooks, \
+                         scheduler)
+    elif engine=="list":
+        if checkpointEvery is not None:
+            raise ValueError("only the vector engine can save checkpoints")
+        if hooks is not None or events or keyed:
+            raise ValueError("only the vector engine can call hooks, "+ \
+                             "schedule events, or use keyed random numbers")
+        return runList(params, seed, maxLoops, recorder, keepSeries)
+    else:
+        raise ValueError("engine must be 'vector' or 'list', not "+repr(engine))
+
+# newSeries() returns an empty dictionary of time series.
+
+def newSeries():
+    return {"healthy": [], "infected": [], "immune": [], "dead": [], \
+            "numPop": []}
+
+# record() appends the counts of one loop to series. startPop is the
+# population size at the start of the simulation.
+
+def record(series, healthy, numPop, immune, startPop):
+    if series is None:
+        return
+    series["healthy"].append(healthy)
+    series["infected"].append(numPop-healthy)
+    series["immune"].append(immune)
+    series["dead"].append(startPop-numPop)
+    series["numPop"].append(numPop)
+
+# runVector() runs the simulation on a VectorEngine.Population, starting
+# from the given time and number of loops already run, so that it can also
+# continue a simulation loaded from a checkpoint. params holds the
+# parameters of runHeadless(), where numPop is the population size at the
+# start of the simulation. A checkpoint does not include the events of
+# scheduler, so a simulation using one cannot save checkpoints.
+
+def runVector(pop, rng, day, hour, loops, params, maxLoops, recorder, \
+              keepSeries, checkpointEvery, checkpointPath, hooks=None, \
+              scheduler=None):
+    if scheduler is not None and checkpointEvery is not None:
+        raise ValueError("cannot save checkpoints of scheduled events")
+    numPop=len(pop)
+    series=newSeries() if keepSeries else None
+    #only a simulation that has already run a loop can be finished
+    healthy=VectorEngine.countHealthy(pop)[0] if loops>0 else 0
+    tally={}
+    while numPop>0 and healthy!=numPop:
+        if maxLoops is not None and loops>=maxLoops:
+            break
+        day, hour=sim.time(day, hour)
+        healthy, infecRate=VectorEngine.step(pop, params["transmissionRate"], \
+                                             params["vaccEffective"], \
+                                             params["deathRate"], \
+                                             params["immunityRate"], rng, tally, \
+                                             hooks, scheduler)
+        numPop=len(pop)
+        record(series, healthy, numPop, int(np.count_nonzero(pop.immune)), \
+               params["numPop"])
+        if recorder is not None:
+            recorder.append(loops, *VectorEngine.countStates(pop), \
+                            tally["deaths"], tally["newInfections"])
+        loops+=1
+        if checkpointEvery is not None and loops%checkpointEvery==0:
+            Checkpoint.saveCheckpoint(checkpointPath.format(loop=loops), pop, \
+                                      rng, day, hour, loops, params)
+    return day, hour, pop, series
+
+# runList() runs the simulation on the 2D list of members used by
+# Covid19Simulation.py, calling the same functions as main() in the same
+# order, except for drawing. seed can also be a np.random.SeedSequence, like
+# the seeds Ensemble.py gives each replicate, which is turned into an integer
+# since the random module cannot be seeded with one.
+
+def runList(params, seed, maxLoops, recorder, keepSeries):
+    if isinstance(seed, np.random.SeedSequence):
+        seed=int(seed.generate_state(1, np.uint64)[0])
+    if seed is not None:
+        random.seed(seed)
+    numPop=params["numPop"]
+    transmissionRate=params["transmissionRate"]
+    vaccEffective=params["vaccEffective"]
+    immunityRate=params["immunityRate"]
+    deathRate=params["deathRate"]
+    members=sim.population(numPop, params["infecRate"], params["vaccRate"])
+    startPop=numPop
+    day=0
+    hour=0
+    loops=0
+    series=newSeries() if keepSeries else None
+    healthy=0
+    while numPop>0 and healthy!=numPop:
+        if maxLoops is not None and loops>=maxLoops:
+            break
+        day, hour=sim.time(day, hour)
+        sim.advanceInfection(members)
+        sim.movePeople(members)
+        collisions=sim.checkCollisions(members)
+        if recorder is not None:
+            before=sum(1 for p in members if p[4])
+        sim.updateStatus(collisions, members, transmissionRate, vaccEffective)
+        if recorder is not None:
+            newInfections=sum(1 for p in members if p[4])-before
+            before=numPop
+        numPop=sim.updateInfec(members, deathRate, numPop, immunityRate)
+        healthy, infecRate=sim.countHealthy(members)
+        record(series, healthy, numPop, sum(1 for p in members if p[7]), \
+               startPop)
+        if recorder is not None:
+            recorder.append(loops, *sim.countStates(members), \
+                            before-numPop, newInfections)
+        loops+=1
+    return day, hour, members, series
@@ -0,0 +1,90 @@
+# Instrumentation.py lets other code watch each stage of a loop of the
+# simulation while it runs. An object with before() and after() methods,
+# such as a subclass of Hooks, is passed as hooks to VectorEngine.step() or
+# Headless.runHeadless(), and is called around movePeople, checkCollisions,
+# updateStatus, and updateInfec in every loop.
+
+# StageCounters is a ready-made set of hooks that adds up how long each stage
+# takes and what it did, to find out why some simulations run much slower
+# than others without running a profiler.
+
+from time import perf_counter
+
+#stages of a loop that hooks are called around, in order
+STAGES=("movePeople", "checkCollisions", "updateStatus", "updateInfec")
+#counts added up by StageCounters, stored in the tally by the stages
+COUNTS=("pairs", "attempts", "newInfections", "deaths", "recoveries", \
+        "becameContagious")
+
+# Hooks does nothing before or after each stage. Subclasses override
+# before() and after() to do something.
+
+class Hooks:
+    # before() is called just before stage runs on pop.
+
+    def before(self, stage, pop):
+        pass
+
+    # after() is called just after stage has run on pop. tally is the
+    # dictionary of counts stored by the stages of this loop so far.
+
+    def after(self, stage, pop, tally):
+        pass
+
+# HookList calls several hooks, in order.
+
+class HookList(Hooks):
+    def __init__(self, *hooks):
+        self.hooks=hooks
+
+    def before(self, stage, pop):
+        for hook in self.hooks:
+            hook.before(stage, pop)
+
+    def after(self, stage, pop, tally):
+        for hook in self.hooks:
+            hook.after(stage, pop, tally)
+
+# StageCounters adds up the seconds spent in each stage (seconds), the
+# number of loops run (loops), and, across all loops, the number of
+# pairs of members in contact, contacts in which the virus could spread,
+# members infected, deaths, and recoveries (counts).
+
+class StageCounters(Hooks):
+    def __init__(self):
+        self.reset()
+
+    # reset() sets every counter back to zero.
+
+    def reset(self):
+        self.seconds=dict.fromkeys(STAGES, 0.0)
+        self.counts=dict.fromkeys(COUNTS, 0)
+        self.loops=0
+        self.started=0.0
+
+    def before(self, stage, pop):
+        self.started=perf_counter()
+
+    def after(self, stage, pop, tally):
+        self.seconds[stage]+=perf_counter()-self.started
+        if stage==STAGES[-1]:
+            self.loops+=1
+            for name in COUNTS:
+                self.counts[name]+=tally.get(name, 0)
+
+    # summary() returns the counters as a dictionary, with the average per
+    # loop of each of them, and the fraction of contacts in which the virus
+    # spread.
+
+    def summary(self):
+        loops=max(self.loops, 1)
+        attempts=self.counts["attempts"]
+        return {"loops": self.loops, \
+                "seconds": dict(self.seconds), \
+                "secondsPerLoop": {stage: self.seconds[stage]/loops \
+                                   for stage in STAGES}, \
+                "counts": dict(self.counts), \
+                "countsPerLoop": {name: self.counts[name]/loops \
+                                  for name in COUNTS}, \
+                "transmissionSuccess": self.counts["newInfections"]/attempts \
+                                       if attempts else 0.0}
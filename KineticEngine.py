@@ -0,0 +1,457 @@
+# KineticEngine.py runs the simulation in continuous time instead of in
+# loops of 0.5 hours. Members move in straight lines at constant speed and
+# only change direction when they bounce off a side of the box or off each
+# other, so the time of the next bounce of every member can be worked out
+# exactly. Like a molecular dynamics simulation, the engine keeps those
+# times in a priority queue and jumps straight from one bounce to the next.
+
+# Time is measured in loops, so one unit of time is 0.5 hours and members
+# move at the same speed as in the other engines. The box is the area
+# movePeople() keeps members in (x from 0 to 502, y from 21 to 502), and two
+# members bounce when their centers are CONTACT apart. The virus can spread
+# every time two members bounce off each other, with the same chances as
+# updateStatus(), and an EventScheduler.InfectionScheduler decides when
+# infections end.
+
+# The scheduler also decides when members become contagious, in the whole
+# loop its contagious event is due in, so that every time is worked out in
+# whole loops instead of by adding up timeSinceInfection, which rounding
+# errors can leave just short of CONTAGIOUS. While no member is contagious,
+# the virus cannot spread, so nothing that happens before the next member
+# becomes contagious or the next infection ends matters except where the
+# members end up. With skipQuiet=True the engine jumps straight to that
+# time, moving the members off the sides of the box in one calculation and
+# letting them pass through each other instead of working out every bounce
+# in between. With skipQuiet=False every bounce is worked out.
+
+# Skipping only helps until the first member becomes contagious. From then
+# on, every bounce is one event handled in Python, about 7000 to 10000 of
+# them per second, so the time taken grows with the number of collisions,
+# which grows faster than the population. Compared with
+# Headless.runHeadless(events=True) with the same seed, a whole run took:
+#   numPop=100, infecRate=0.02:  0.28 s instead of 0.47 s
+#   numPop=100, infecRate=0.50:  0.39 s instead of 1.48 s
+#   numPop=300, infecRate=0.01:  7.6 s instead of 9.3 s
+#   numPop=500, infecRate=0.01: 15.2 s instead of 6.9 s
+# so this engine is only faster for populations of a few hundred members or
+# fewer, and then by a few times at most; for larger populations the loop
+# engines are faster.
+
+# Members that are placed overlapping and moving towards each other collide
+# straight away, and in a crowded box every bounce sets off more of them, so
+# the number of collisions grows without end. The members can only all fit
+# in the box without overlapping while they cover at most PACKING of its
+# area, the most that circles of the same size can cover, so a simulation
+# of more members raises a ValueError. Even below that, collisions become
+# far more frequent as the box fills up: each member collides about 0.01
+# times per loop with 200 members, 0.17 times with 1250 (half of the area),
+# and 2 times with 2500.
+
+import heapq
+import math
+import numpy as np
+import VectorEngine
+import EventScheduler
+
+#sides of the box that members bounce off
+LEFT=0.0
+RIGHT=502.0
+TOP=21.0
+BOTTOM=502.0
+CONTACT=VectorEngine.CONTACT
+#no member ever collides
+NEVER=math.inf
+#distance within which members are listed as partners that might collide
+REACH=3*CONTACT
+#largest part of the area of the box that the members can cover
+PACKING=math.pi/(2*math.sqrt(3))
+
+# reflect() returns where a member that starts at position and moves at
+# speed for time ends up between the sides low and high, bouncing off them,
+# and the speed it ends up with.
+
+def reflect(position, speed, time, low, high):
+    width=high-low
+    travelled=np.mod(position-low+speed*time, 2*width)
+    back=travelled>width
+    return np.where(back, high-(travelled-width), low+travelled), \
+           np.where(back, -speed, speed)
+
+# KineticSimulation runs the simulation on pop. The rates have the same
+# meaning as in main() in Covid19Simulation.py. A population that covers
+# more than PACKING of the box raises a ValueError.
+
+class KineticSimulation:
+    def __init__(self, pop, transmissionRate, vaccEffective, deathRate, \
+                 immunityRate, rng, skipQuiet=True):
+        covered=len(pop)*math.pi*(CONTACT/2)**2/((RIGHT-LEFT)*(BOTTOM-TOP))
+        if covered>PACKING:
+            raise ValueError(str(len(pop))+" members cover "+ \
+                             str(round(100*covered))+"% of the box, more "+ \
+                             "than the "+str(round(100*PACKING))+ \
+                             "% they can cover without overlapping")
+        self.pop=pop
+        self.transmissionRate=transmissionRate/100
+        self.vaccEffective=vaccEffective/100
+        self.rng=rng
+        self.skipQuiet=skipQuiet
+        self.now=0.0
+        #population() can place members slightly outside the box
+        np.clip(pop.x, LEFT, RIGHT, out=pop.x)
+        np.clip(pop.y, TOP, BOTTOM, out=pop.y)
+        self.scheduler=EventScheduler.InfectionScheduler(pop, deathRate, \
+                                                         immunityRate, rng)
+        self.tally=dict.fromkeys(("collisions", "wallHits", "newInfections", \
+                                  "deaths", "recoveries", "fastForwards"), 0)
+        self.rebuild()
+
+    # rebuild() predicts the next event of every member from scratch. This
+    # is needed at the start, after jumping ahead, after members die, which
+    # changes the indices of the members, and when the list of partners
+    # expires. Partners are only looked for within REACH, using the cells of
+    # VectorEngine.findContacts(), and each member's partners are kept for
+    # predict(). Members further apart than that cannot collide until they
+    # have closed the gap at the highest speed there is, so the list is
+    # good until then (expires), and events after that are thrown away by
+    # the next rebuild().
+
+    def rebuild(self):
+        pop=self.pop
+        n=len(pop)
+        self.counts=np.zeros(n, dtype=np.int64)
+        self.queue=[]
+        self.sequence=0
+        self.speedLimit=float(np.hypot(pop.dx, pop.dy).max()) if n else 0.0
+        rows, cols=VectorEngine.findContacts(pop, REACH)
+        members=np.concatenate((rows, cols))
+        partners=np.concatenate((cols, rows))
+        #list the partners of each member together
+        order=np.argsort(members, kind="stable")
+        self.partners=partners[order]
+        self.starts=np.searchsorted(members[order], np.arange(n+1))
+        #how much closer than REACH members can have come since slackTime
+        self.slack=REACH-CONTACT
+        self.slackTime=self.now
+        self.expires=self.now+self.slack/(2*self.speedLimit) \
+                     if self.speedLimit>0 else NEVER
+
+        times, partners=self.collisionTimes(members, partners, n)
+        walls=np.minimum(*self.wallTimes(np.arange(n)))
+        for i, time, partner, wall in zip(range(n), times.tolist(), \
+                                          partners.tolist(), walls.tolist()):
+            if time<wall:
+                event=(self.now+time, self.sequence, i, partner, 0, 0)
+            else:
+                event=(self.now+wall, self.sequence, i, -1, 0, 0)
+            self.queue.append(event)
+            self.sequence+=1
+        heapq.heapify(self.queue)
+
+    # raiseSpeedLimit() makes speed the highest speed there is, if it is
+    # higher, and brings forward the time the list of partners expires, since
+    # members can now close the gap between them sooner.
+
+    def raiseSpeedLimit(self, speed):
+        if speed<=self.speedLimit:
+            return
+        self.slack-=2*self.speedLimit*(self.now-self.slackTime)
+        self.slackTime=self.now
+        self.speedLimit=speed
+        self.expires=self.now+self.slack/(2*speed)
+
+    # pairTimes() returns how long until member a collides with member b, for
+    # each pair of members in a and b, if nothing else changes, or NEVER.
+    # Members already overlapping and moving towards each other collide
+    # straight away.
+
+    def pairTimes(self, a, b):
+        pop=self.pop
+        relX=pop.x[b]-pop.x[a]
+        relY=pop.y[b]-pop.y[a]
+        velX=pop.dx[b]-pop.dx[a]
+        velY=pop.dy[b]-pop.dy[a]
+        closing=relX*velX+relY*velY
+        speed=velX**2+velY**2
+        gap=relX**2+relY**2-CONTACT**2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            disc=closing**2-speed*gap
+            times=(-closing-np.sqrt(disc))/speed
+        return np.where((closing<0) & (disc>0), np.maximum(times, 0), NEVER)
+
+    # collisionTimes() returns, for each of the n members, how long until it
+    # collides with the first of its partners, where partners[k] is a partner
+    # of members[k], and which partner that is (-1 if none of its partners
+    # ever collides with it).
+
+    def collisionTimes(self, members, partners, n):
+        times=self.pairTimes(members, partners)
+        colliding=times<NEVER
+        members=members[colliding]
+        partners=partners[colliding]
+        times=times[colliding]
+        first=np.full(n, NEVER)
+        np.minimum.at(first, members, times)
+        partner=np.full(n, -1)
+        soonest=times==first[members]
+        partner[members[soonest]]=partners[soonest]
+        return first, partner
+
+    # wallTimes() returns how long until each member in members reaches a
+    # side of the box going left or right, and going up or down.
+
+    def wallTimes(self, members):
+        pop=self.pop
+        with np.errstate(divide="ignore", invalid="ignore"):
+            timeX=np.where(pop.dx[members]>0, \
+                           (RIGHT-pop.x[members])/pop.dx[members], \
+                           np.where(pop.dx[members]<0, \
+                                    (LEFT-pop.x[members])/pop.dx[members], \
+                                    NEVER))
+            timeY=np.where(pop.dy[members]>0, \
+                           (BOTTOM-pop.y[members])/pop.dy[members], \
+                           np.where(pop.dy[members]<0, \
+                                    (TOP-pop.y[members])/pop.dy[members], \
+                                    NEVER))
+        return np.maximum(timeX, 0), np.maximum(timeY, 0)
+
+    # wallTime() is wallTimes() for the single member i, which is quicker
+    # to work out without arrays.
+
+    def wallTime(self, i):
+        pop=self.pop
+        dx=float(pop.dx[i])
+        dy=float(pop.dy[i])
+        timeX=NEVER
+        if dx>0:
+            timeX=(RIGHT-float(pop.x[i]))/dx
+        elif dx<0:
+            timeX=(LEFT-float(pop.x[i]))/dx
+        timeY=NEVER
+        if dy>0:
+            timeY=(BOTTOM-float(pop.y[i]))/dy
+        elif dy<0:
+            timeY=(TOP-float(pop.y[i]))/dy
+        return max(timeX, 0.0), max(timeY, 0.0)
+
+    # predict() adds the next event of member i to the queue, looking for its
+    # partner among the partners listed by rebuild().
+
+    def predict(self, i):
+        partners=self.partners[self.starts[i]:self.starts[i+1]]
+        times=self.pairTimes(i, partners)
+        k=int(np.argmin(times)) if len(partners) else 0
+        j=int(partners[k]) if len(partners) else -1
+        wall=min(self.wallTime(i))
+        if j>=0 and times[k]<wall:
+            event=(self.now+float(times[k]), self.sequence, i, j, \
+                   int(self.counts[i]), int(self.counts[j]))
+        else:
+            event=(self.now+wall, self.sequence, i, -1, int(self.counts[i]), 0)
+        self.sequence+=1
+        heapq.heappush(self.queue, event)
+
+    # nextEvent() returns the next event that is still going to happen as a
+    # tuple of its time and the members involved (-1 for a side of the box),
+    # without removing it, or None if there are no events. Events of members
+    # that have bounced since the event was predicted are thrown away, and
+    # members whose partner has bounced are predicted again.
+
+    def nextEvent(self):
+        while self.queue:
+            time, sequence, i, j, countI, countJ=self.queue[0]
+            if self.counts[i]!=countI:
+                heapq.heappop(self.queue)
+            elif j>=0 and self.counts[j]!=countJ:
+                heapq.heappop(self.queue)
+                self.predict(i)
+            else:
+                return time, i, j
+        return None
+
+    # advance() moves every member and advances every infection to time.
+
+    def advance(self, time):
+        pop=self.pop
+        elapsed=time-self.now
+        pop.x+=pop.dx*elapsed
+        pop.y+=pop.dy*elapsed
+        pop.timeSinceInfection[pop.infected]+=0.5*elapsed
+        self.now=time
+
+    # fastForward() jumps to time, moving the members as if they could pass
+    # through each other, and predicts all events again. Jumping to a time
+    # that is not later than now would never end, so it raises a
+    # RuntimeError.
+
+    def fastForward(self, time):
+        pop=self.pop
+        elapsed=time-self.now
+        if not elapsed>0:
+            raise RuntimeError("cannot fast forward from "+str(self.now)+ \
+                               " to "+str(time))
+        pop.x, pop.dx=reflect(pop.x, pop.dx, elapsed, LEFT, RIGHT)
+        pop.y, pop.dy=reflect(pop.y, pop.dy, elapsed, TOP, BOTTOM)
+        pop.timeSinceInfection[pop.infected]+=0.5*elapsed
+        self.now=time
+        self.tally["fastForwards"]+=1
+        self.rebuild()
+
+    # bounceWall() bounces member i off the side of the box it reached, and
+    # puts it exactly on that side, so that rounding errors can never leave
+    # it outside the box.
+
+    def bounceWall(self, i):
+        pop=self.pop
+        timeX, timeY=self.wallTime(i)
+        if timeX<=timeY:
+            pop.x[i]=RIGHT if pop.dx[i]>0 else LEFT
+            pop.dx[i]*=-1
+        else:
+            pop.y[i]=BOTTOM if pop.dy[i]>0 else TOP
+            pop.dy[i]*=-1
+        self.counts[i]+=1
+        self.tally["wallHits"]+=1
+        self.predict(i)
+
+    # bounceMembers() bounces members i and j off each other and decides if
+    # the virus spreads between them.
+
+    def bounceMembers(self, i, j):
+        pop=self.pop
+        VectorEngine.collide(pop, i, j)
+        self.counts[i]+=1
+        self.counts[j]+=1
+        self.tally["collisions"]+=1
+        #keep the highest speed rebuild() relies on up to date
+        self.raiseSpeedLimit(max(math.hypot(pop.dx[i], pop.dy[i]), \
+                                 math.hypot(pop.dx[j], pop.dy[j])))
+        contagious=self.scheduler.contagious
+        for source, target in ((i, j), (j, i)):
+            if contagious[source] and not pop.infected[target] and \
+               not pop.immune[target]:
+                chance=self.transmissionRate
+                if pop.vaccStatus[target]:
+                    chance*=1-self.vaccEffective
+                if self.rng.random()<=chance:
+                    pop.infected[target]=True
+                    pop.timeSinceInfection[target]=0
+                    self.scheduler.loop=int(self.now)
+                    self.scheduler.infect(pop.ids[[target]], self.rng)
+                    self.tally["newInfections"]+=1
+                break
+        self.predict(i)
+        self.predict(j)
+
+    # becomeContagious() marks the members whose contagious events are due at
+    # the current time, which is a whole number of loops, as contagious, and
+    # makes sure their timeSinceInfection has reached CONTAGIOUS.
+
+    def becomeContagious(self):
+        pop=self.pop
+        before=self.scheduler.contagious.copy()
+        self.scheduler.updateContagious(pop, None, int(self.now))
+        became=self.scheduler.contagious & ~before
+        pop.timeSinceInfection[became]=np.maximum( \
+            pop.timeSinceInfection[became], VectorEngine.CONTAGIOUS)
+
+    # endInfections() handles the events of the scheduler due at the current
+    # time, which is a whole number of loops.
+
+    def endInfections(self):
+        tally={}
+        before=len(self.pop)
+        self.scheduler.loop=int(self.now)-1
+        self.scheduler.updateInfec(self.pop, self.rng, tally)
+        self.tally["deaths"]+=tally["deaths"]
+        self.tally["recoveries"]+=tally["recoveries"]
+        if len(self.pop)!=before:
+            self.rebuild()
+
+    # contagiousAt() returns the time at which the next member becomes
+    # contagious, which is a whole number of loops, or NEVER.
+
+    def contagiousAt(self):
+        loop=self.scheduler.nextContagious()
+        return NEVER if loop is None else float(loop)
+
+    # quietUntil() returns the time until which no member is contagious, or
+    # None if a member is contagious now.
+
+    def quietUntil(self):
+        if self.scheduler.contagious.any():
+            return None
+        return self.contagiousAt()
+
+    # run() runs the simulation until no members are infected, or until
+    # maxLoops loops of time have passed. Returns a tuple of the final day and
+    # hour, the population, and a dictionary of time series sampled every
+    # sampleEvery loops, holding the loop ("loop") and the number of healthy,
+    # infected, immune, and dead members at that time.
+
+    def run(self, maxLoops=None, sampleEvery=48):
+        pop=self.pop
+        end=NEVER if maxLoops is None else float(maxLoops)
+        startPop=len(pop)
+        series={"loop": [], "healthy": [], "infected": [], "immune": [], \
+                "dead": []}
+        nextSample=0.0
+        while len(pop)>0 and pop.infected.any() and self.now<end:
+            ending=self.scheduler.queue[0][0] if self.scheduler.queue \
+                   else NEVER
+            contagion=self.contagiousAt()
+            quiet=self.quietUntil() if self.skipQuiet else None
+            if quiet is not None:
+                target=min(quiet, ending, end)
+                self.fastForward(target)
+                event=None
+            else:
+                event=self.nextEvent()
+                target=min(event[0] if event else NEVER, contagion, ending, \
+                           self.expires, end)
+                if event is not None and event[0]==target:
+                    heapq.heappop(self.queue)
+                self.advance(target)
+
+            while nextSample<=self.now:
+                infec=int(np.count_nonzero(pop.infected))
+                series["loop"].append(nextSample)
+                series["healthy"].append(len(pop)-infec)
+                series["infected"].append(infec)
+                series["immune"].append(int(np.count_nonzero(pop.immune)))
+                series["dead"].append(startPop-len(pop))
+                nextSample+=sampleEvery
+
+            if target==contagion:
+                self.becomeContagious()
+            if event is not None and event[0]==target:
+                #handle the bounce first, before indices can change
+                self.handle(event)
+            if target==ending:
+                self.endInfections()
+            if quiet is None and target==self.expires:
+                self.rebuild()
+
+        hours=self.now*0.5
+        day=int(hours//24)
+        return day, hours-24*day, pop, series
+
+    # handle() handles a bounce returned by nextEvent().
+
+    def handle(self, event):
+        time, i, j=event
+        if j<0:
+            self.bounceWall(i)
+        else:
+            self.bounceMembers(i, j)
+
+# runKinetic() creates a population like Headless.runHeadless() and runs it
+# with a KineticSimulation. Returns the result of KineticSimulation.run().
+
+def runKinetic(numPop=100, infecRate=0.50, vaccRate=10.0, vaccEffective=50.0, \
+               immunityRate=50.0, transmissionRate=10.0, deathRate=0.00026, \
+               seed=None, maxLoops=None, skipQuiet=True, sampleEvery=48):
+    rng=np.random.default_rng(seed)
+    pop=VectorEngine.population(numPop, infecRate, vaccRate, rng)
+    simulation=KineticSimulation(pop, transmissionRate, vaccEffective, \
+                                 deathRate, immunityRate, rng, skipQuiet)
+    return simulation.run(maxLoops, sampleEvery)
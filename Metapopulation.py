@@ -0,0 +1,173 @@
+# Metapopulation.py runs several boxes side by side, each with its own
+# population and parameters, and moves members between them. The boxes stand
+# for linked places, like towns or campuses, so infected members can now
+# enter a population from outside it.
+
+# The boxes do not affect each other between migrations, so each box runs
+# on its own worker process for interval loops at a time. The workers then
+# send their populations back, members are moved between the boxes, and the
+# next interval starts. migration[i][j] is the chance that a member of box i
+# moves to box j at each migration. Migrants keep their infection,
+# vaccination and immunity, and are placed at a random spot in their new
+# box.
+
+# Every box and the migrations have their own random number streams, spawned
+# from one seed, so a run does not depend on how many workers there are.
+
+from concurrent.futures import ProcessPoolExecutor
+import os
+import numpy as np
+import Covid19Simulation
+import VectorEngine
+import Headless
+import Sweep
+
+# merge() returns a Population holding the members of every population in
+# pops, ordered by their ids.
+
+def merge(pops):
+    arrays=[np.concatenate([getattr(pop, name) for pop in pops]) \
+            for name in VectorEngine.FIELDS]
+    order=np.argsort(arrays[-1], kind="stable")
+    return VectorEngine.Population(*[array[order] for array in arrays])
+
+# runBox() runs loops loops of the simulation on the population of one box.
+# dead is the number of members that have died in the box so far. A box in
+# which no one is infected stops early, since only movement would change in
+# it, and its time series is filled up to loops entries with its final
+# counts. Returns the population, the random number generator, and the time
+# series of the box, which must all be sent back to the main process.
+
+def runBox(pop, rng, params, loops, dead):
+    series=Headless.newSeries()
+    #dead members are counted against the size at the start of the interval
+    startPop=len(pop)+dead
+    healthy=VectorEngine.countHealthy(pop)[0]
+    for i in range(loops):
+        if healthy==len(pop):
+            break
+        healthy, infecRate=VectorEngine.step(pop, \
+                                             params["transmissionRate"], \
+                                             params["vaccEffective"], \
+                                             params["deathRate"], \
+                                             params["immunityRate"], rng)
+        Headless.record(series, healthy, len(pop), \
+                        int(np.count_nonzero(pop.immune)), startPop)
+    ran=len(series["numPop"])
+    if ran<loops:
+        if ran==0:
+            Headless.record(series, healthy, len(pop), \
+                            int(np.count_nonzero(pop.immune)), startPop)
+        for name in series:
+            series[name]+=[series[name][-1]]*(loops-len(series[name]))
+    return pop, rng, series, ran
+
+# migrate() moves members between the populations in pops, using the
+# chances in migration. Returns the new populations and how many members
+# moved from each box to each other box.
+
+def migrate(pops, migration, rng):
+    boxes=len(pops)
+    moves=[[] for box in pops]
+    moved=np.zeros((boxes, boxes), dtype=np.int64)
+    for box, pop in enumerate(pops):
+        chances=np.array(migration[box], dtype=np.float64)
+        chances[box]=0
+        chances[box]=1-chances.sum()
+        destination=rng.choice(boxes, size=len(pop), p=chances)
+        moved[box]=np.bincount(destination, minlength=boxes)
+        for other in range(boxes):
+            chosen=destination==other
+            part=VectorEngine.Population(*[getattr(pop, name)[chosen] \
+                                           for name in VectorEngine.FIELDS])
+            if other!=box:
+                #place the migrants at random spots in the new box
+                part.x=rng.random(len(part))*500
+                part.y=rng.uniform(20, 512, len(part))
+            moves[other].append(part)
+    np.fill_diagonal(moved, 0)
+    return [merge(parts) for parts in moves], moved
+
+# checkMigration() raises a ValueError unless migration is a boxes by boxes
+# matrix of chances whose rows, leaving out the diagonal, add up to at most 1.
+
+def checkMigration(migration, boxes):
+    matrix=np.array(migration, dtype=np.float64)
+    if matrix.shape!=(boxes, boxes):
+        raise ValueError("migration must be a %d by %d matrix" % \
+                         (boxes, boxes))
+    np.fill_diagonal(matrix, 0)
+    if (matrix<0).any() or (matrix.sum(axis=1)>1).any():
+        raise ValueError("migration chances must be at least 0 and add up "+ \
+                         "to at most 1 for each box")
+
+# runMetapopulation() runs the simulation on one box for each dictionary of
+# parameters in boxes, which uses the names and defaults of
+# Headless.runHeadless(), until no member of any box is infected, all
+# members have died, or maxLoops loops have run. Every interval loops (48 is
+# one day), members move between the boxes with the chances in migration.
+# Returns a tuple of the final day and hour, a list of the final population
+# of each box, and a dictionary holding a list of the time series of each
+# box ("boxes"), the time series of all boxes together ("total"), and the
+# number of members that moved from each box to each other box at every
+# migration ("migrations").
+
+def runMetapopulation(boxes, migration, interval=48, seed=None, \
+                      maxLoops=None, workers=None):
+    boxes=[dict(Sweep.PARAMETERS, **params) for params in boxes]
+    checkMigration(migration, len(boxes))
+    seeds=np.random.SeedSequence(seed).spawn(len(boxes)+1)
+    rngs=[np.random.default_rng(seq) for seq in seeds[:-1]]
+    migrationRng=np.random.default_rng(seeds[-1])
+
+    #number the members of all boxes differently, so that ids stay unique
+    pops=[]
+    first=0
+    for params, rng in zip(boxes, rngs):
+        pop=VectorEngine.population(params["numPop"], params["infecRate"], \
+                                    params["vaccRate"], rng)
+        pop.ids+=first
+        first+=len(pop)
+        pops.append(pop)
+
+    if workers is None:
+        workers=min(len(boxes), os.cpu_count() or 1)
+    dead=[0]*len(boxes)
+    series={"boxes": [Headless.newSeries() for box in boxes], \
+            "total": Headless.newSeries(), "migrations": []}
+    day=0
+    hour=0
+    loops=0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            total=sum(len(pop) for pop in pops)
+            infected=sum(int(np.count_nonzero(pop.infected)) for pop in pops)
+            if total==0 or infected==0:
+                break
+            if maxLoops is not None and loops>=maxLoops:
+                break
+            length=interval if maxLoops is None else \
+                   min(interval, maxLoops-loops)
+            results=list(pool.map(runBox, pops, rngs, boxes, \
+                                  [length]*len(boxes), dead))
+            pops=[result[0] for result in results]
+            rngs=[result[1] for result in results]
+            #the run ends with the last loop any box still had infections in
+            if all(len(pop)==0 or not pop.infected.any() for pop in pops):
+                length=max(max(result[3] for result in results), 1)
+            for box, result in enumerate(results):
+                boxSeries=result[2]
+                for name in boxSeries:
+                    series["boxes"][box][name]+=boxSeries[name][:length]
+                dead[box]=boxSeries["dead"][length-1]
+            for i in range(length):
+                day, hour=Covid19Simulation.time(day, hour)
+            loops+=length
+            if length==interval:
+                pops, moved=migrate(pops, migration, migrationRng)
+                series["migrations"].append(moved)
+
+    for name in series["total"]:
+        series["total"][name]=[sum(values) for values in \
+                               zip(*[box[name] for box in series["boxes"]])]
+    return day, hour, pops, series
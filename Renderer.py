@@ -0,0 +1,187 @@
+# Renderer.py runs the simulation and draws it at the same time, without
+# the drawing slowing the simulation down. The simulation runs at full speed
+# on a separate thread, while the main thread (which has to own the Draw
+# window) draws the latest state of the simulation at most fps times a
+# second. Loops that finish between two frames are simply never drawn.
+
+# Instead of clearing and redrawing the whole board every frame like main()
+# in Covid19Simulation.py, the key and the parameters that cannot change are
+# drawn once. Each frame only paints over the box, the time, and the
+# infection rate and population size, and draws the members again.
+
+import sys
+import threading
+from time import perf_counter, sleep
+import numpy as np
+import Draw
+import Covid19Simulation as sim
+import VectorEngine
+
+#color of the members with each code of VectorEngine.stateCodes()
+COLORS={VectorEngine.CONTAGIOUS_CODE: Draw.RED, \
+        VectorEngine.INCUBATING_CODE: Draw.ORANGE, \
+        VectorEngine.HEALTHY_CODE: Draw.GREEN, \
+        VectorEngine.IMMUNE_CODE: Draw.VIOLET}
+
+# Snapshots passes the state of the simulation from the simulation thread to
+# the main thread. The main thread asks for a snapshot with request(); the
+# simulation thread checks wanted() after each loop and only then copies the
+# positions and colors of the members, so loops that are not drawn cost
+# nothing extra.
+
+class Snapshots:
+    def __init__(self):
+        self.lock=threading.Lock()
+        self.asked=threading.Event()
+        self.latest=None
+        self.finished=False
+
+    def request(self):
+        self.asked.set()
+
+    def wanted(self):
+        return self.asked.is_set()
+
+    # put() stores the state of pop at the given time, replacing any snapshot
+    # that was not drawn yet.
+
+    def put(self, pop, day, hour, infecRate):
+        snapshot=(day, hour, infecRate, pop.x.copy(), pop.y.copy(), \
+                  VectorEngine.stateCodes(pop))
+        with self.lock:
+            self.latest=snapshot
+        self.asked.clear()
+
+    # take() returns the latest snapshot, or None if there is no new one.
+
+    def take(self):
+        with self.lock:
+            snapshot=self.latest
+            self.latest=None
+        return snapshot
+
+# simulate() runs the simulation on pop, like the loop of main(), and keeps
+# snapshots up to date. The final snapshot is always stored.
+
+def simulate(pop, params, snapshots, seed=None):
+    rng=np.random.default_rng(seed)
+    day=0
+    hour=0
+    numPop=len(pop)
+    healthy=0
+    infecRate=params["infecRate"]
+    while numPop>0 and healthy!=numPop:
+        day, hour=sim.time(day, hour)
+        healthy, infecRate=VectorEngine.step(pop, params["transmissionRate"], \
+                                             params["vaccEffective"], \
+                                             params["deathRate"], \
+                                             params["immunityRate"], rng)
+        numPop=len(pop)
+        if snapshots.wanted():
+            snapshots.put(pop, day, hour, infecRate)
+    snapshots.put(pop, day, hour, infecRate)
+    snapshots.finished=True
+
+# drawStatic() clears the board and draws the parts of it that do not change
+# while the simulation runs: the lines around the box, the key, and the
+# parameters other than the infection rate and population size.
+
+def drawStatic(params):
+    Draw.clear()
+    Draw.setColor(Draw.BLACK)
+    Draw.line(512, 0, 512, 512)
+    Draw.setFontSize(24)
+    Draw.string("Vaccination Rate: "+str(params["vaccRate"])[0:4]+"%", 552, 100)
+    Draw.string("Vaccination Effective: "+str(params["vaccEffective"])[0:4]+ \
+                "%", 552, 140)
+    Draw.string("Transmission Rate: "+str(params["transmissionRate"])[0:4]+ \
+                "%", 552, 180)
+    Draw.string("Immunity Rate: "+str(params["immunityRate"])[0:4]+"%", \
+                552, 220)
+    sim.drawKey(Draw.RED, 300)
+    sim.drawKey(Draw.ORANGE, 330)
+    sim.drawKey(Draw.GREEN, 360)
+    sim.drawKey(Draw.VIOLET, 390)
+    Draw.setFontSize(18)
+    Draw.setColor(Draw.BLACK)
+    Draw.string("INFECTED, CONTAGIOUS", 550, 300)
+    Draw.string("INFECTED, NOT CONTAGIOUS", 550, 330)
+    Draw.string("HEALTHY", 550, 360)
+    Draw.string("IMMUNE", 550, 390)
+
+# drawFrame() paints over the parts of the board that change and draws a
+# snapshot on them. Members of the same color are drawn together so the
+# color is only set four times per frame.
+
+def drawFrame(snapshot):
+    day, hour, infecRate, x, y, codes=snapshot
+    #paint over the box and the changing parameters
+    Draw.setColor(Draw.WHITE)
+    Draw.filledRect(0, 0, 511, 512)
+    Draw.filledRect(552, 20, 348, 70)
+
+    #time elapsed since start of simulation, as drawn by drawBoard()
+    Draw.setFontSize(12)
+    Draw.setColor(Draw.BLACK)
+    Draw.line(0, 20, 512, 20)
+    Draw.string("DAY: "+str(day), 5, 5)
+    if int(hour)<10:
+        Draw.string("HOUR: 0"+str(hour)[0], 55 , 5)
+    else:
+        Draw.string("HOUR: "+str(hour)[0:2], 55 , 5)
+    Draw.setFontSize(24)
+    Draw.string("Infection Rate: "+str(infecRate*100)[0:4] +"%", 552, 20)
+    Draw.string("Population Size: " + str(len(x)), 552, 60)
+
+    for code, color in COLORS.items():
+        Draw.setColor(color)
+        chosen=codes==code
+        for memberX, memberY in zip(x[chosen].tolist(), y[chosen].tolist()):
+            Draw.filledOval(memberX, memberY, 10, 10)
+    Draw.show()
+
+# runDecoupled() simulates pop with the parameters in params (the names used
+# by Headless.runHeadless()) on a separate thread, drawing it at most fps
+# times a second until the simulation ends. Returns the final day and hour.
+
+def runDecoupled(pop, params, fps=30, seed=None):
+    snapshots=Snapshots()
+    thread=threading.Thread(target=simulate, \
+                            args=(pop, params, snapshots, seed), daemon=True)
+    drawStatic(params)
+    snapshots.request()
+    thread.start()
+
+    frame=1/fps
+    day=0
+    hour=0
+    while True:
+        started=perf_counter()
+        finished=snapshots.finished
+        snapshot=snapshots.take()
+        if snapshot is not None:
+            day, hour=snapshot[0], snapshot[1]
+            drawFrame(snapshot)
+        if finished:
+            break
+        snapshots.request()
+        #wait for the rest of the frame
+        sleep(max(0, frame-(perf_counter()-started)))
+    thread.join()
+    return day, hour
+
+# main() lets the user choose the parameters like main() in
+# Covid19Simulation.py, then runs the simulation with runDecoupled().
+
+def main(fps=30):
+    Draw.setCanvasSize(900, 512)
+    members, infecRate, numPop, vaccRate, vaccEffective, immunityRate, \
+    transmissionRate, deathRate=sim.chooseParameters()
+    params={"infecRate": infecRate, "vaccRate": vaccRate, \
+            "vaccEffective": vaccEffective, "immunityRate": immunityRate, \
+            "transmissionRate": transmissionRate, "deathRate": deathRate}
+    day, hour=runDecoupled(VectorEngine.fromMembers(members), params, fps)
+    sim.closingPage(day, hour)
+
+if __name__=="__main__":
+    main(*[int(arg) for arg in sys.argv[1:2]])
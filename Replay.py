@@ -0,0 +1,136 @@
+# Replay.py plays back a simulation recorded by Trajectory.py on the same
+# board main() in Covid19Simulation.py draws, without running the
+# simulation again. Any range of loops can be played, at any speed, and
+# the buttons below the key move through the recording:
+#   <<  and  >>     go back or forward one day
+#   PAUSE / PLAY    stop or continue playing
+#   -  and  +       halve or double the speed
+#   the bar         jump to the loop at that point of the range
+
+# Usage:
+#   python Replay.py run.c19traj [start] [stop] [loops per second]
+
+import sys
+from time import perf_counter, sleep
+import numpy as np
+import Draw
+import Renderer
+import Sweep
+import Trajectory
+import VectorEngine
+
+#loops in a day
+DAY=48
+#left, top, width, and height of each button, and its label
+BUTTONS={"back": (552, 430, 40, 26, "<<"), \
+         "pause": (600, 430, 80, 26, "PAUSE"), \
+         "forward": (688, 430, 40, 26, ">>"), \
+         "slower": (736, 430, 30, 26, "-"), \
+         "faster": (774, 430, 30, 26, "+")}
+#left, top, width, and height of the bar showing where in the range we are
+BAR=(552, 470, 320, 14)
+
+# inside() returns whether the point x, y is inside the rectangle.
+
+def inside(x, y, rect):
+    left, top, width, height=rect[:4]
+    return left<=x<=left+width and top<=y<=top+height
+
+# drawControls() paints over the buttons and the bar and draws them again,
+# with the bar filled up to tick within the range from start to stop.
+
+def drawControls(tick, start, stop, speed, paused):
+    Draw.setColor(Draw.WHITE)
+    Draw.filledRect(552, 420, 348, 92)
+    Draw.setFontSize(14)
+    for name, (left, top, width, height, label) in BUTTONS.items():
+        Draw.setColor(Draw.BLACK)
+        Draw.rect(left, top, width, height)
+        if name=="pause" and paused:
+            label="PLAY"
+        Draw.string(label, left+5, top+5)
+    left, top, width, height=BAR
+    Draw.rect(left, top, width, height)
+    done=(tick-start)/max(stop-1-start, 1)
+    Draw.setColor(Draw.BLUE)
+    Draw.filledRect(left+1, top+1, max(0, (width-2)*done), height-2)
+    Draw.setColor(Draw.BLACK)
+    Draw.setFontSize(12)
+    Draw.string("LOOP "+str(tick)+"  "+str(speed)[0:6]+" LOOPS/S", left, \
+                top+height+4)
+
+# snapshot() returns loop tick of trajectory in the form drawn by
+# Renderer.drawFrame().
+
+def snapshot(trajectory, tick):
+    day, hour, x, y, codes=trajectory.loop(tick)
+    infected=np.count_nonzero((codes==VectorEngine.CONTAGIOUS_CODE) | \
+                              (codes==VectorEngine.INCUBATING_CODE))
+    infecRate=infected/len(codes) if len(codes) else 0.0
+    return day, hour, infecRate, x, y, codes
+
+# replay() plays the loops of the recording at path from start up to but
+# not including stop, at speed loops per second, drawing at most fps frames
+# a second, until the window is closed. Playing pauses at the last loop, and
+# pressing PLAY there starts again from start. Parameters that were not
+# saved with the recording are shown with their defaults.
+
+def replay(path, start=0, stop=None, speed=96.0, fps=30):
+    trajectory=Trajectory.Trajectory(path)
+    stop=len(trajectory) if stop is None else min(stop, len(trajectory))
+    start=min(max(start, 0), max(stop-1, 0))
+    if stop<=start:
+        raise ValueError("no loops recorded between "+str(start)+" and "+ \
+                         str(stop))
+    Draw.setCanvasSize(900, 512)
+    Renderer.drawStatic(dict(Sweep.PARAMETERS, **trajectory.params))
+
+    frame=1/fps
+    position=float(start)
+    paused=False
+    drawn=None
+    while True:
+        started=perf_counter()
+        if Draw.mousePressed():
+            x=Draw.mouseX()
+            y=Draw.mouseY()
+            if inside(x, y, BUTTONS["back"]):
+                position=max(start, position-DAY)
+            elif inside(x, y, BUTTONS["forward"]):
+                position=min(stop-1, position+DAY)
+            elif inside(x, y, BUTTONS["pause"]):
+                #playing again from the end starts from the beginning
+                if paused and int(position)>=stop-1:
+                    position=float(start)
+                paused=not paused
+            elif inside(x, y, BUTTONS["slower"]):
+                speed/=2
+            elif inside(x, y, BUTTONS["faster"]):
+                speed*=2
+            elif inside(x, y, BAR):
+                done=(x-BAR[0])/BAR[2]
+                position=start+done*(stop-1-start)
+            drawn=None
+
+        tick=int(position)
+        if tick!=drawn:
+            drawControls(tick, start, stop, speed, paused)
+            Renderer.drawFrame(snapshot(trajectory, tick))
+            drawn=tick
+        if not paused:
+            position+=speed*frame
+            if position>=stop-1:
+                position=float(stop-1)
+                paused=True
+                drawn=None
+        sleep(max(0, frame-(perf_counter()-started)))
+
+def main(args):
+    path=args[0]
+    start=int(args[1]) if len(args)>1 else 0
+    stop=int(args[2]) if len(args)>2 else None
+    speed=float(args[3]) if len(args)>3 else 96.0
+    replay(path, start, stop, speed)
+
+if __name__=="__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,405 @@
+# Service.py runs the simulation as a small HTTP service on this computer,
+# so that several tools can ask for the same scenarios without each running
+# its own copy. A scenario is the parameters of setParameters() in
+# Covid19Simulation.py, a seed, and a number of replicates, and is sent as
+# JSON. The replicates of each scenario are run on a pool of worker
+# processes with at most workers runs at a time.
+
+# Every scenario is a job, named after a hash of its parameters. A scenario
+# that is already running or finished is not run again; the existing job is
+# returned instead. Each replicate is also saved in a Sweep.ResultCache
+# under the same key Sweep.sweep() uses, so the results outlive the service
+# and are shared with sweeps.
+
+# Requests:
+#   POST /jobs                submit a scenario, for example
+#                             {"numPop": 500, "seed": 1, "replicates": 10}
+#   GET  /jobs                list every job and its status
+#   GET  /jobs/<id>           the status, progress, and result of a job
+#   GET  /jobs/<id>/events    progress of a job as it runs, one JSON object
+#                             per line, until the job ends
+
+# The service remembers at most MAX_JOBS jobs. When a new job would go past
+# that, the jobs that finished first are forgotten (their replicates stay in
+# the cache); if every job is still running, the new one is refused.
+
+# The service only listens on 127.0.0.1 and uses no other services.
+# Usage:
+#   python Service.py --port 8019 --workers 4
+
+import argparse
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import numpy as np
+import Headless
+import Ensemble
+import Sweep
+
+HOST="127.0.0.1"
+#how many loops pass between progress reports of a replicate
+PROGRESS_EVERY=48
+#longest request body accepted, in bytes
+MAX_BODY=1<<16
+#most jobs kept at once
+MAX_JOBS=1000
+#most replicates, members, and loops a scenario can ask for
+MAX_REPLICATES=1000
+MAX_POP=100000
+MAX_LOOPS=1000000
+#parameters given as percentages, from 0 to 100
+PERCENTAGES=("vaccRate", "vaccEffective", "immunityRate", "transmissionRate")
+REASONS={200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", \
+         405: "Method Not Allowed", 413: "Payload Too Large", \
+         503: "Service Unavailable"}
+
+# Busy is raised by Service.submit() when it already has MAX_JOBS jobs that
+# are still running.
+
+class Busy(Exception):
+    pass
+
+# ProgressRecorder is passed to Headless.runHeadless() as its recorder, and
+# sends the number of loops run by a replicate to the service every
+# PROGRESS_EVERY loops.
+
+class ProgressRecorder:
+    def __init__(self, queue, job, replicate):
+        self.queue=queue
+        self.job=job
+        self.replicate=replicate
+
+    def append(self, loop, *counts):
+        if (loop+1)%PROGRESS_EVERY==0:
+            self.queue.put((self.job, self.replicate, loop+1))
+
+# runReplicate() runs replicate replicate of a job on a worker process. It
+# uses the same seed as Sweep.runPoint(), so the result is the same as a
+# sweep's.
+
+def runReplicate(job, params, seed, replicate, maxLoops, queue):
+    stream=np.random.SeedSequence(seed, spawn_key=(replicate,))
+    day, hour, pop, series=Headless.runHeadless( \
+        seed=stream, maxLoops=maxLoops, \
+        recorder=ProgressRecorder(queue, job, replicate), **params)
+    return {name: series[name] for name in Ensemble.METRICS}
+
+# scenario() checks the JSON object submitted for a job and returns the
+# parameters, seed, number of replicates, and maxLoops it asks for. numPop
+# must be between 0 and MAX_POP, infecRate between 0 and 1, deathRate at
+# least 0, the PERCENTAGES between 0 and 100, replicates at most
+# MAX_REPLICATES, and maxLoops at most MAX_LOOPS, so that no scenario can
+# tie up the service for good. Raises a ValueError describing the first
+# problem found.
+
+def scenario(body):
+    if not isinstance(body, dict):
+        raise ValueError("a scenario must be a JSON object")
+    body=dict(body)
+    seed=body.pop("seed", 0)
+    replicates=body.pop("replicates", 1)
+    maxLoops=body.pop("maxLoops", None)
+    if not isinstance(seed, int) or seed<0:
+        raise ValueError("seed must be a whole number of at least 0")
+    if not isinstance(replicates, int) or not 1<=replicates<=MAX_REPLICATES:
+        raise ValueError("replicates must be a whole number from 1 to "+ \
+                         str(MAX_REPLICATES))
+    if maxLoops is not None and (not isinstance(maxLoops, int) or \
+                                 not 1<=maxLoops<=MAX_LOOPS):
+        raise ValueError("maxLoops must be a whole number from 1 to "+ \
+                         str(MAX_LOOPS))
+    for name, value in body.items():
+        if name not in Sweep.PARAMETERS:
+            raise ValueError("unknown parameter "+repr(name))
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(name+" must be a number")
+    params={name: float(value) for name, value in \
+            dict(Sweep.PARAMETERS, **body).items()}
+    if not 0<=params["numPop"]<=MAX_POP:
+        raise ValueError("numPop must be between 0 and "+str(MAX_POP))
+    params["numPop"]=int(params["numPop"])
+    if not 0<=params["infecRate"]<=1:
+        raise ValueError("infecRate must be between 0 and 1")
+    if not params["deathRate"]>=0:
+        raise ValueError("deathRate must be at least 0")
+    for name in PERCENTAGES:
+        if not 0<=params[name]<=100:
+            raise ValueError(name+" must be between 0 and 100")
+    return params, seed, replicates, maxLoops
+
+# Job keeps track of one scenario: its progress while it runs, and its
+# result when it finishes. Whenever anything changes, version goes up and
+# changed is notified.
+
+class Job:
+    def __init__(self, name, params, seed, replicates, maxLoops):
+        self.name=name
+        self.params=params
+        self.seed=seed
+        self.replicates=replicates
+        self.maxLoops=maxLoops
+        self.status="queued"
+        self.loops=[0]*replicates
+        self.finished=0
+        self.result=None
+        self.error=None
+        self.version=0
+        self.changed=asyncio.Condition()
+
+    # describe() returns the job as a JSON object; the result is only
+    # included if withResult is True.
+
+    def describe(self, withResult=True):
+        described={"id": self.name, "status": self.status, \
+                   "params": self.params, "seed": self.seed, \
+                   "replicates": self.replicates, "maxLoops": self.maxLoops, \
+                   "loops": self.loops, "finished": self.finished}
+        if self.error is not None:
+            described["error"]=self.error
+        if withResult and self.result is not None:
+            described["result"]=self.result
+        return described
+
+    async def notify(self):
+        async with self.changed:
+            self.version+=1
+            self.changed.notify_all()
+
+# summarize() turns the result of Ensemble.aggregate() into lists that can
+# be sent as JSON.
+
+def summarize(result):
+    summary={"quantiles": list(result["quantiles"]), \
+             "loops": result["loops"].tolist()}
+    for name in Ensemble.METRICS:
+        summary[name]={"mean": result[name]["mean"].tolist(), \
+                       "quantiles": result[name]["quantiles"].tolist()}
+    return summary
+
+# Service holds the jobs, the worker processes, and the cache. Reading and
+# writing the cache blocks, so it is done on a thread of its own (io) rather
+# than holding up every other request; one thread is enough, and means the
+# cache is never used by two threads at once.
+
+class Service:
+    def __init__(self, workers=None, cache=None):
+        self.pool=ProcessPoolExecutor(max_workers=workers)
+        self.io=ThreadPoolExecutor(max_workers=1)
+        self.cache=Sweep.ResultCache() if cache is None else cache
+        self.jobs={}
+        self.manager=mp.Manager()
+        self.progress=self.manager.Queue()
+
+    # submit() returns the job for a scenario, starting it if no identical
+    # scenario has been submitted before, and whether it is new. Raises Busy
+    # if there is no room for a new job.
+
+    def submit(self, params, seed, replicates, maxLoops):
+        key=json.dumps({"params": params, "seed": seed, \
+                        "replicates": replicates, "maxLoops": maxLoops}, \
+                       sort_keys=True)
+        name=hashlib.sha256(key.encode()).hexdigest()[:16]
+        job=self.jobs.get(name)
+        if job is not None and job.status!="failed":
+            return job, False
+        self.jobs.pop(name, None)
+        self.forget()
+        job=Job(name, params, seed, replicates, maxLoops)
+        self.jobs[name]=job
+        asyncio.get_running_loop().create_task(self.run(job))
+        return job, True
+
+    # forget() removes the jobs that were submitted first among those that
+    # have finished, until there is room for a new job. Raises Busy if every
+    # job is still running.
+
+    def forget(self):
+        for name in [name for name, job in self.jobs.items() \
+                     if job.status in ("done", "failed")]:
+            if len(self.jobs)<MAX_JOBS:
+                break
+            del self.jobs[name]
+        if len(self.jobs)>=MAX_JOBS:
+            raise Busy("too many jobs are running")
+
+    # lookUp() returns the keys of the replicates of job and the runs of
+    # them found in the cache (None for the rest). It blocks, so it is run on
+    # the io thread.
+
+    def lookUp(self, job):
+        keys=[Sweep.runKey(job.params, job.seed, r, job.maxLoops) \
+              for r in range(job.replicates)]
+        return keys, [self.cache.get(key) for key in keys]
+
+    # run() runs the replicates of job that are not in the cache on the
+    # worker processes, and stores the combined result in job.
+
+    async def run(self, job):
+        loop=asyncio.get_running_loop()
+
+        async def runOne(r, key):
+            runs[r]=await loop.run_in_executor( \
+                self.pool, runReplicate, job.name, job.params, job.seed, r, \
+                job.maxLoops, self.progress)
+            await loop.run_in_executor(self.io, self.cache.put, key, runs[r])
+            job.loops[r]=len(runs[r][Ensemble.METRICS[0]])
+            job.finished+=1
+            await job.notify()
+
+        try:
+            keys, runs=await loop.run_in_executor(self.io, self.lookUp, job)
+            pending=[]
+            for r in range(job.replicates):
+                if runs[r] is None:
+                    pending.append((r, keys[r]))
+                else:
+                    job.loops[r]=len(runs[r][Ensemble.METRICS[0]])
+                    job.finished+=1
+            job.status="running"
+            await job.notify()
+            await asyncio.gather(*[runOne(r, key) for r, key in pending])
+            job.result=await loop.run_in_executor( \
+                self.io, lambda: summarize(Ensemble.aggregate(runs)))
+            job.status="done"
+        except Exception as error:
+            job.error=repr(error)
+            job.status="failed"
+        await job.notify()
+
+    # watchProgress() passes progress reports from the worker processes on
+    # to their jobs, until the service stops.
+
+    async def watchProgress(self):
+        loop=asyncio.get_running_loop()
+        while True:
+            report=await loop.run_in_executor(None, self.progress.get)
+            if report is None:
+                break
+            name, replicate, loops=report
+            job=self.jobs.get(name)
+            if job is not None and job.status=="running":
+                job.loops[replicate]=max(job.loops[replicate], loops)
+                await job.notify()
+
+    # handle() answers one HTTP request.
+
+    async def handle(self, reader, writer):
+        try:
+            request=await reader.readline()
+            method, path, version=request.decode("latin-1").split()
+            headers={}
+            while True:
+                line=(await reader.readline()).decode("latin-1").strip()
+                if not line:
+                    break
+                name, value=line.split(":", 1)
+                headers[name.strip().lower()]=value.strip()
+            length=int(headers.get("content-length", 0))
+            if length>MAX_BODY:
+                await respond(writer, 413, {"error": "body too long"})
+                return
+            body=await reader.readexactly(length) if length else b""
+            await self.route(method, path.rstrip("/"), body, writer)
+        except (ValueError, asyncio.IncompleteReadError):
+            await respond(writer, 400, {"error": "malformed request"})
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body, writer):
+        parts=path.split("/")[1:]
+        if parts==["jobs"]:
+            if method=="GET":
+                await respond(writer, 200, [job.describe(False) for job in \
+                                            self.jobs.values()])
+            elif method=="POST":
+                try:
+                    job, new=self.submit(*scenario(json.loads(body or b"{}")))
+                except ValueError as error:
+                    await respond(writer, 400, {"error": str(error)})
+                    return
+                except Busy as error:
+                    await respond(writer, 503, {"error": str(error)})
+                    return
+                await respond(writer, 201 if new else 200, \
+                              job.describe(False))
+            else:
+                await respond(writer, 405, {"error": "use GET or POST"})
+            return
+        job=self.jobs.get(parts[1]) if len(parts) in (2, 3) and \
+            parts[0]=="jobs" else None
+        if job is None or (len(parts)==3 and parts[2]!="events"):
+            await respond(writer, 404, {"error": "no such job"})
+        elif method!="GET":
+            await respond(writer, 405, {"error": "use GET"})
+        elif len(parts)==2:
+            await respond(writer, 200, job.describe())
+        else:
+            await self.stream(job, writer)
+
+    # stream() sends the progress of job every time it changes, one JSON
+    # object per line, ending with the job's final status.
+
+    async def stream(self, job, writer):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson"+ \
+                     b"\r\nTransfer-Encoding: chunked\r\n"+ \
+                     b"Connection: close\r\n\r\n")
+        seen=-1
+        while True:
+            #wait for a change without holding the lock while sending, so a
+            #slow reader does not hold up the job
+            async with job.changed:
+                await job.changed.wait_for(lambda: job.version!=seen)
+                seen=job.version
+                ended=job.status in ("done", "failed")
+                line=json.dumps(job.describe(False)).encode()+b"\n"
+            writer.write(b"%x\r\n%s\r\n" % (len(line), line))
+            await writer.drain()
+            if ended:
+                break
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    # serve() answers requests on port until cancelled.
+
+    async def serve(self, port):
+        server=await asyncio.start_server(self.handle, HOST, port)
+        watcher=asyncio.get_running_loop().create_task(self.watchProgress())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.progress.put(None)
+            await watcher
+            self.pool.shutdown(cancel_futures=True)
+            self.io.shutdown()
+            self.manager.shutdown()
+
+# respond() sends a whole JSON response.
+
+async def respond(writer, status, data):
+    body=json.dumps(data).encode()
+    writer.write((("HTTP/1.1 %d %s\r\nContent-Type: application/json\r\n"+ \
+                  "Content-Length: %d\r\nConnection: close\r\n\r\n") % \
+                 (status, REASONS[status], len(body))).encode()+body)
+    await writer.drain()
+
+def main(args=None):
+    parser=argparse.ArgumentParser(description="Run simulations for "+ \
+                                   "other programs on this computer.")
+    parser.add_argument("--port", type=int, default=8019)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--cache", help="directory of the result cache")
+    args=parser.parse_args(args)
+    cache=Sweep.ResultCache(args.cache) if args.cache else None
+    try:
+        asyncio.run(Service(args.workers, cache).serve(args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__=="__main__":
+    main()
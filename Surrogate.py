@@ -0,0 +1,258 @@
+# Surrogate.py estimates the results of the simulation in milliseconds,
+# without simulating any members. Instead of following every member, it only
+# keeps track of how many members are in each state, and moves expected
+# numbers of members between the states every loop: a mean-field model with
+# the same states and parameters as the simulation.
+
+# The states follow the simulation loop by loop. Members infected in the same
+# loop are kept together, so that they become contagious exactly 480 loops
+# (timeSinceInfection 240) later and can die or recover from 960 loops
+# (timeSinceInfection 480) on, with the same chances as in updateInfec().
+# Vaccinated and unvaccinated members are counted separately, since the
+# virus spreads to them with different chances.
+
+# The one thing that cannot be worked out from the parameters is how often
+# members come into contact, which depends on how crowded the box is.
+# calibrate() measures it by fitting the surrogate to an ensemble of full
+# simulations with a given population size, and a Surrogate uses the rates of
+# several calibrations to estimate any population size between them. When
+# the population size is outside the calibrated sizes, or the fit was poor,
+# estimate() reports that it is not confident, and whatIf() runs the full
+# simulation instead.
+
+import json
+import math
+import numpy as np
+import VectorEngine
+import Ensemble
+import Sweep
+
+#loops from infection until a member is contagious, and can die or recover
+CONTAGIOUS_LOOPS=int(VectorEngine.CONTAGIOUS*2)
+RECOVERY_LOOPS=int(VectorEngine.RECOVERY*2)
+#chance that an infected member who can die or recover stays infected,
+#as in updateInfec()
+STAY_CHANCE=.80
+
+# endChances() returns the chance that a member who can die or recover dies
+# in a loop, the chance that they recover, and the chance that a member who
+# recovers becomes immune, exactly as updateInfec() draws them.
+
+def endChances(deathRate, immunityRate):
+    die=min(1.0, deathRate*100)
+    recover=(1-die)*(1-STAY_CHANCE)
+    immunityRate=immunityRate/100
+    immune=0.0 if die>=1 else max(0.0, immunityRate-die)/(1-die)
+    return die, recover, min(1.0, immune)
+
+# simulate() runs the surrogate with the parameters of Headless.runHeadless()
+# and contactRate, the average number of members each member is in contact
+# with per loop, until fewer than half a member is infected or maxLoops
+# loops have run. With ordered=True, as in VectorEngine.updateInfec(), only
+# the members before the first one who stays infected can die or recover in
+# a loop. Returns a dictionary of time series like runHeadless(), holding
+# expected numbers of members.
+
+def simulate(contactRate, numPop=100, infecRate=0.50, vaccRate=10.0, \
+             vaccEffective=50.0, immunityRate=50.0, transmissionRate=10.0, \
+             deathRate=0.00026, maxLoops=None, ordered=True):
+    #the counts are kept as plain floats, which are far quicker than NumPy
+    #for a handful of numbers per loop; the names ending in V count the
+    #vaccinated members
+    vaccinated=int((vaccRate/100)*numPop)/numPop if numPop else 0.0
+    infected=int(infecRate*numPop)
+    susceptible=(1-vaccinated)*(numPop-infected)
+    susceptibleV=vaccinated*(numPop-infected)
+    chance=transmissionRate/100
+    chanceV=(1-vaccEffective/100)*chance
+    die, recover, immune=endChances(deathRate, immunityRate)
+    end=die+recover
+
+    #cohorts[t%RECOVERY_LOOPS] holds the members infected in loop t, until
+    #they can die or recover and join late
+    cohorts=[0.0]*RECOVERY_LOOPS
+    cohortsV=[0.0]*RECOVERY_LOOPS
+    cohorts[0]=(1-vaccinated)*infected
+    cohortsV[0]=vaccinated*infected
+    incubating=infected
+    contagious=0.0
+    late=0.0
+    lateV=0.0
+    numImmune=0.0
+    alive=float(numPop)
+    series={"healthy": [], "infected": [], "immune": [], "dead": [], \
+            "numPop": []}
+    loop=0
+    while alive>=0.5 and incubating+contagious+late+lateV>=0.5:
+        if maxLoops is not None and loop>=maxLoops:
+            break
+        loop+=1
+        slot=loop%RECOVERY_LOOPS
+        #members infected CONTAGIOUS_LOOPS ago are now contagious, and
+        #members infected RECOVERY_LOOPS ago can now die or recover
+        before=(loop-CONTAGIOUS_LOOPS)%RECOVERY_LOOPS
+        incubating-=cohorts[before]+cohortsV[before]
+        contagious+=cohorts[before]+cohortsV[before]
+        contagious-=cohorts[slot]+cohortsV[slot]
+        late+=cohorts[slot]
+        lateV+=cohortsV[slot]
+
+        #each contact with a contagious member is a chance of infection
+        pressure=contactRate*(contagious+late+lateV)/max(alive, 1)
+        cohorts[slot]=susceptible*-math.expm1(-pressure*chance)
+        cohortsV[slot]=susceptibleV*-math.expm1(-pressure*chanceV)
+        susceptible-=cohorts[slot]
+        susceptibleV-=cohortsV[slot]
+        incubating+=cohorts[slot]+cohortsV[slot]
+
+        #members who can die or recover
+        numLate=late+lateV
+        if numLate>0:
+            if ordered:
+                #the expected number of members before the first who stays
+                ending=numLate if end>=1 else \
+                       min(numLate, end*(1-end**numLate)/(1-end))
+                ending=ending/numLate
+            else:
+                ending=end
+            deaths=numLate*ending*(die/end if end>0 else 0)
+            recoveries=late*ending*(recover/end if end>0 else 0)
+            recoveriesV=lateV*ending*(recover/end if end>0 else 0)
+            late-=late*ending
+            lateV-=lateV*ending
+            alive-=deaths
+            numImmune+=(recoveries+recoveriesV)*immune
+            susceptible+=recoveries*(1-immune)
+            susceptibleV+=recoveriesV*(1-immune)
+
+        numInfected=incubating+contagious+late+lateV
+        series["healthy"].append(alive-numInfected)
+        series["infected"].append(numInfected)
+        series["immune"].append(numImmune)
+        series["dead"].append(numPop-alive)
+        series["numPop"].append(alive)
+    return series
+
+# fitError() returns how far the infected curve of the surrogate is from
+# target, the average infected curve of the simulation, as the root mean
+# square difference divided by the population size. The shorter curve keeps
+# its final value until the end of the longer one.
+
+def fitError(series, target, numPop):
+    ran=np.asarray(series["infected"], dtype=np.float64)
+    target=np.asarray(target, dtype=np.float64)
+    length=max(len(ran), len(target))
+    if length==0:
+        return 0.0
+    ran=np.pad(ran, (0, length-len(ran)), mode="edge") if len(ran) else \
+        np.zeros(length)
+    target=np.pad(target, (0, length-len(target)), mode="edge")
+    return float(np.sqrt(np.mean((ran-target)**2))/max(numPop, 1))
+
+# calibrate() runs an ensemble of replicates full simulations with the
+# parameters in params (see Ensemble.runEnsemble()) and finds the contact
+# rate with which the surrogate's infected curve best matches their average.
+# The contact rate is searched for between low and high contacts per member
+# per loop. Returns a dictionary with the population size ("numPop"), the
+# contact rate found ("contactRate"), and the fitError() of the fit
+# ("error").
+
+def calibrate(replicates=20, seed=0, workers=None, maxLoops=None, \
+              low=1e-4, high=10.0, tolerance=1e-3, **params):
+    params=dict(Sweep.PARAMETERS, **params)
+    target=Ensemble.runEnsemble(replicates, seed, workers, maxLoops, \
+                                **params)["infected"]["mean"]
+    loops=len(target)
+
+    def error(logRate):
+        return fitError(simulate(math.exp(logRate), maxLoops=loops, \
+                                 **params), target, params["numPop"])
+
+    #golden section search on the logarithm of the contact rate
+    ratio=(math.sqrt(5)-1)/2
+    a, b=math.log(low), math.log(high)
+    c, d=b-ratio*(b-a), a+ratio*(b-a)
+    errorC, errorD=error(c), error(d)
+    while b-a>tolerance:
+        if errorC<errorD:
+            b, d, errorD=d, c, errorC
+            c=b-ratio*(b-a)
+            errorC=error(c)
+        else:
+            a, c, errorC=c, d, errorD
+            d=a+ratio*(b-a)
+            errorD=error(d)
+    best=(a+b)/2
+    return {"numPop": params["numPop"], "contactRate": math.exp(best), \
+            "error": error(best)}
+
+# Surrogate estimates the simulation for any population size from a list of
+# calibrations made by calibrate(). Contacts per member grow with how
+# crowded the box is, so the contact rate per member of the population is
+# interpolated between the calibrated population sizes.
+
+class Surrogate:
+    def __init__(self, calibrations=(), maxError=0.05):
+        self.calibrations=sorted(calibrations, key=lambda c: c["numPop"])
+        self.maxError=maxError
+
+    # add() adds a calibration made by calibrate().
+
+    def add(self, calibration):
+        self.calibrations=sorted(self.calibrations+[calibration], \
+                                 key=lambda c: c["numPop"])
+
+    # contactRate() returns the contact rate for numPop members, and whether
+    # it is confident in it: numPop is within the calibrated sizes, and the
+    # calibrations on both sides of it fit well.
+
+    def contactRate(self, numPop):
+        if not self.calibrations:
+            raise ValueError("the surrogate has not been calibrated")
+        sizes=[c["numPop"] for c in self.calibrations]
+        perMember=[c["contactRate"]/max(c["numPop"], 1) \
+                   for c in self.calibrations]
+        rate=float(np.interp(numPop, sizes, perMember))*numPop
+        above=int(np.searchsorted(sizes, numPop))
+        nearest=self.calibrations[max(0, above-1):above+1]
+        confident=sizes[0]<=numPop<=sizes[-1] and \
+                  all(c["error"]<=self.maxError for c in nearest)
+        return rate, confident
+
+    # estimate() runs the surrogate with the parameters of
+    # Headless.runHeadless(). Returns the time series from simulate() and
+    # whether the estimate can be trusted.
+
+    def estimate(self, maxLoops=None, ordered=True, **params):
+        params=dict(Sweep.PARAMETERS, **params)
+        rate, confident=self.contactRate(params["numPop"])
+        return simulate(rate, maxLoops=maxLoops, ordered=ordered, \
+                        **params), confident
+
+    # save() writes the calibrations to a JSON file, which load() reads back.
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump({"maxError": self.maxError, \
+                       "calibrations": self.calibrations}, f, indent=1)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            saved=json.load(f)
+        return cls(saved["calibrations"], saved["maxError"])
+
+# whatIf() answers a what-if question about the parameters in params with
+# the surrogate when it is confident, and otherwise with an ensemble of
+# replicates full simulations. Returns a dictionary of average time series
+# and whether they came from the surrogate.
+
+def whatIf(surrogate, replicates=20, seed=None, workers=None, \
+           maxLoops=None, **params):
+    series, confident=surrogate.estimate(maxLoops, **params)
+    if confident:
+        return series, True
+    result=Ensemble.runEnsemble(replicates, seed, workers, maxLoops, \
+                                **params)
+    return {name: result[name]["mean"].tolist() for name in \
+            Ensemble.METRICS}, False
@@ -0,0 +1,205 @@
+# Sweep.py runs the simulation for every combination of a grid of parameter
+# values, on a pool of worker processes. The result of every run is saved in
+# a cache on disk, under the full set of parameters and the seed of the run,
+# so running a sweep that overlaps with an earlier one only runs the
+# combinations that have not been run before.
+
+# The cache holds at most maxBytes of results. When it grows past that, the
+# results that were used least recently are deleted. Every key includes
+# MODEL_VERSION, so that results saved by an older version of the model are
+# never returned once it changes.
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import hashlib
+import itertools
+import json
+import os
+import numpy as np
+import Ensemble
+
+#parameters that can be swept, and their defaults, the same as in main()
+PARAMETERS={"numPop": 100, "infecRate": 0.50, "vaccRate": 10.0, \
+            "vaccEffective": 50.0, "immunityRate": 50.0, \
+            "transmissionRate": 10.0, "deathRate": 0.00026}
+
+#version of the model the cached results come from; raise it whenever a
+#change to the model changes the results of a run with the same seed
+MODEL_VERSION=1
+
+#where results are cached if no other directory is given
+DEFAULT_CACHE=os.path.join(os.path.expanduser("~"), ".covid19simulation", \
+                           "sweep")
+
+# ResultCache saves the time series of single runs as files in directory,
+# one file per run, named after a hash of the run's key. The directory is
+# only scanned when the cache is created and when it grows past maxBytes;
+# in between, the size of every file and the order in which they were last
+# used are kept in files, so saving a run does not have to look at every
+# other file.
+
+class ResultCache:
+    def __init__(self, directory=DEFAULT_CACHE, maxBytes=1<<30):
+        self.directory=directory
+        self.maxBytes=maxBytes
+        os.makedirs(directory, exist_ok=True)
+        self.scan()
+
+    # scan() reads the size and last use of every saved run, since other
+    # processes sharing the directory may have saved or deleted runs.
+    # files maps each path to its size, least recently used first.
+
+    def scan(self):
+        found=[]
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npz"):
+                try:
+                    info=entry.stat()
+                except FileNotFoundError:
+                    continue
+                found.append((info.st_mtime, entry.path, info.st_size))
+        found.sort()
+        self.files=OrderedDict((path, size) for mtime, path, size in found)
+        self.total=sum(self.files.values())
+
+    # path() returns the file in which the run with the given key is saved.
+
+    def path(self, key):
+        name=hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.directory, name+".npz")
+
+    # get() returns the saved time series of the run with the given key, or
+    # None if it has not been saved. Reading a run marks it as recently used.
+
+    def get(self, key):
+        path=self.path(key)
+        try:
+            with np.load(path) as saved:
+                if str(saved["key"])!=key:
+                    return None
+                series={name: saved[name].tolist() for name in \
+                        Ensemble.METRICS}
+            os.utime(path)
+        except (OSError, KeyError, ValueError):
+            return None
+        if path in self.files:
+            self.files.move_to_end(path)
+        return series
+
+    # put() saves the time series of the run with the given key and then
+    # evicts old runs if the cache is too big. The file is written under a
+    # temporary name first so that other processes never read half a file.
+
+    def put(self, key, series):
+        path=self.path(key)
+        temp=path+"."+str(os.getpid())+".tmp"
+        with open(temp, "wb") as f:
+            np.savez_compressed(f, key=np.array(key), **{name: \
+                                np.asarray(series[name], dtype=np.int64) \
+                                for name in Ensemble.METRICS})
+        size=os.path.getsize(temp)
+        os.replace(temp, path)
+        self.total+=size-self.files.pop(path, 0)
+        self.files[path]=size
+        if self.total>self.maxBytes:
+            self.evict()
+
+    # evict() deletes the least recently used runs until the cache holds no
+    # more than maxBytes. It scans the directory first, so that runs saved
+    # by other processes are counted too.
+
+    def evict(self):
+        self.scan()
+        while self.total>self.maxBytes and self.files:
+            path, size=self.files.popitem(last=False)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.total-=size
+
+# normalize() returns every parameter of a run, including the defaults that
+# were not swept, as plain Python numbers: numPop as an int and the rest as
+# floats, whatever type the swept values had (for example NumPy floats from
+# np.linspace()).
+
+def normalize(params):
+    full=dict(PARAMETERS)
+    full.update(params)
+    full["numPop"]=int(full["numPop"])
+    for name in full:
+        if name!="numPop":
+            full[name]=float(full[name])
+    return full
+
+# runKey() returns the key under which a run is cached: MODEL_VERSION,
+# every parameter of the run (see normalize()), the seed, the replicate
+# number, and maxLoops. A run is only the same every time it is run if seed
+# is a whole number of at least 0, so any other seed raises a ValueError
+# rather than caching a run that cannot be repeated.
+
+def runKey(params, seed, replicate, maxLoops):
+    if isinstance(seed, bool) or not isinstance(seed, (int, np.integer)) or \
+       seed<0:
+        raise ValueError("seed must be a whole number of at least 0, not "+ \
+                         repr(seed))
+    full=normalize(params)
+    return json.dumps({"model": MODEL_VERSION, "params": full, \
+                       "seed": int(seed), "replicate": replicate, \
+                       "maxLoops": maxLoops}, sort_keys=True)
+
+# grid() returns a list of dictionaries, one for every combination of the
+# values in ranges, which maps parameter names to lists or ranges of values.
+
+def grid(ranges):
+    for name in ranges:
+        if name not in PARAMETERS:
+            raise ValueError("cannot sweep unknown parameter "+repr(name))
+    names=sorted(ranges)
+    return [dict(zip(names, values)) for values in \
+            itertools.product(*[list(ranges[name]) for name in names])]
+
+# runPoint() runs one replicate of one combination of parameters. The seed
+# of replicate r is the same one Ensemble.runEnsemble() would give it.
+
+def runPoint(params, seed, replicate, maxLoops):
+    stream=np.random.SeedSequence(seed, spawn_key=(replicate,))
+    return Ensemble.runReplicate(params, stream, maxLoops)
+
+# sweep() runs replicates runs of every combination of the values in ranges,
+# for example sweep({"numPop": range(100, 1001, 100),
+# "transmissionRate": [5.0, 10.0, 20.0]}), and returns a list with one tuple
+# of the parameters and Ensemble.aggregate() of its runs for each
+# combination. Runs found in cache are not run again, and new runs are saved
+# to cache as soon as they finish, so an interrupted sweep keeps its progress.
+# seed must be a whole number (see runKey()).
+
+def sweep(ranges, replicates=1, seed=0, workers=None, maxLoops=None, \
+          cache=None, quantiles=(0.05, 0.5, 0.95)):
+    if cache is None:
+        cache=ResultCache()
+    points=grid(ranges)
+    #run exactly the parameters the runs are cached under
+    full=[normalize(point) for point in points]
+    runs=[[None]*replicates for point in points]
+
+    #find the runs that are not in the cache
+    missing=[]
+    for p in range(len(points)):
+        for r in range(replicates):
+            key=runKey(points[p], seed, r, maxLoops)
+            runs[p][r]=cache.get(key)
+            if runs[p][r] is None:
+                missing.append((p, r, key))
+
+    if missing:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures={pool.submit(runPoint, full[p], seed, r, maxLoops): \
+                     (p, r, key) for p, r, key in missing}
+            for future in as_completed(futures):
+                p, r, key=futures[future]
+                runs[p][r]=future.result()
+                cache.put(key, runs[p][r])
+
+    return [(points[p], Ensemble.aggregate(runs[p], quantiles)) \
+            for p in range(len(points))]
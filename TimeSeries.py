@@ -0,0 +1,117 @@
+# TimeSeries.py records the counts of a simulation after every loop to a
+# file, without keeping the whole history in memory. Each loop appends one
+# row with the number of members in each color drawn by drawPeople()
+# (contagious, infected but not contagious, healthy, and immune), and the
+# number of deaths and new infections in that loop.
+
+# Rows are collected in a buffer of chunkSize rows, and each full buffer is
+# written to the file as one chunk. Within a chunk the values are stored one
+# column at a time as 32 bit integers, so a file can be read back one column
+# and one chunk at a time.
+
+# File layout:
+#   MAGIC
+#   4 byte length of the header, followed by the header as JSON
+#   chunks, each a 4 byte number of rows followed by each column in turn
+
+import csv
+import json
+import struct
+import numpy as np
+
+MAGIC=b"C19SERIES"
+VERSION=1
+DTYPE=np.dtype("<i4")
+COLUMNS=("loop", "contagious", "incubating", "healthy", "immune", "deaths", \
+         "newInfections")
+
+# SeriesRecorder writes rows to the file at path. Use it in a with statement,
+# or call close() at the end, so that the last partial chunk is written.
+
+class SeriesRecorder:
+    def __init__(self, path, chunkSize=4096, columns=COLUMNS):
+        self.columns=tuple(columns)
+        self.chunkSize=chunkSize
+        self.buffer=np.zeros((len(self.columns), chunkSize), dtype=DTYPE)
+        self.rows=0
+        self.file=open(path, "wb")
+        header=json.dumps({"version": VERSION, "columns": self.columns, \
+                           "dtype": DTYPE.str}).encode()
+        self.file.write(MAGIC+struct.pack("<I", len(header))+header)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # append() adds one row, with one value per column in order.
+
+    def append(self, *values):
+        self.buffer[:, self.rows]=values
+        self.rows+=1
+        if self.rows==self.chunkSize:
+            self.flush()
+
+    # flush() writes the rows in the buffer as one chunk.
+
+    def flush(self):
+        if self.rows==0:
+            return
+        self.file.write(struct.pack("<I", self.rows))
+        self.file.write(self.buffer[:, :self.rows].tobytes())
+        self.rows=0
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+# readHeader() reads the header of an open file and returns its columns.
+
+def readHeader(f):
+    if f.read(len(MAGIC))!=MAGIC:
+        raise ValueError("not a time series file")
+    size,=struct.unpack("<I", f.read(4))
+    header=json.loads(f.read(size))
+    if header["version"]!=VERSION:
+        raise ValueError("unsupported time series version "+ \
+                         str(header["version"]))
+    return tuple(header["columns"])
+
+# readChunks() reads the file at path one chunk at a time, yielding a
+# dictionary mapping each column to an array of its values in the chunk.
+
+def readChunks(path):
+    with open(path, "rb") as f:
+        columns=readHeader(f)
+        while True:
+            size=f.read(4)
+            if len(size)<4:
+                break
+            rows,=struct.unpack("<I", size)
+            data=np.frombuffer(f.read(rows*len(columns)*DTYPE.itemsize), \
+                               dtype=DTYPE).reshape(len(columns), rows)
+            yield dict(zip(columns, data))
+
+# readSeries() reads the whole file at path and returns a dictionary mapping
+# each column to an array of all of its values.
+
+def readSeries(path):
+    chunks=list(readChunks(path))
+    with open(path, "rb") as f:
+        columns=readHeader(f)
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) \
+            if chunks else np.zeros(0, dtype=DTYPE) for name in columns}
+
+# exportCsv() converts the file at path to a CSV file at csvPath, one chunk
+# at a time.
+
+def exportCsv(path, csvPath):
+    with open(path, "rb") as f:
+        columns=readHeader(f)
+    with open(csvPath, "w", newline="") as out:
+        writer=csv.writer(out)
+        writer.writerow(columns)
+        for chunk in readChunks(path):
+            writer.writerows(zip(*[chunk[name].tolist() for name in columns]))
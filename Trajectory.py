@@ -0,0 +1,174 @@
+# Trajectory.py records where every member is and what color it is drawn in
+# (see VectorEngine.stateCodes()) after every loop of a simulation, so the
+# simulation can be watched afterwards with Replay.py without running it
+# again or drawing it while it runs. A TrajectoryRecorder is a set of hooks
+# (see Instrumentation.py), passed as hooks to Headless.runHeadless(), and
+# does not need the Draw module, so it can be used on computers without a
+# display.
+
+# Loops are stored in chunks of chunkTicks loops. Each member has a fixed
+# slot, its id, so members that have died are stored with the code DEAD.
+# Every chunk has the same size and starts at a multiple of ALIGN bytes, so
+# the loop at any tick can be found without reading the loops before it, and
+# the file is memory-mapped instead of read. The recorder fills one chunk at
+# a time through a memory map, and updates the number of loops in the file
+# after every chunk, so a file can be replayed while it is still being
+# written.
+
+# File layout:
+#   MAGIC
+#   8 byte number of loops recorded
+#   4 byte length of the header, followed by the header as JSON
+#   the chunks, each holding, one after another, the day and hour of each
+#   loop (float64), the x and y of each member at each loop (float32), and
+#   the code of each member at each loop (uint8)
+
+import json
+import struct
+import numpy as np
+import Covid19Simulation
+import Instrumentation
+import VectorEngine
+
+MAGIC=b"C19TRAJECTORY"
+VERSION=1
+ALIGN=64
+#code of members who have died
+DEAD=255
+
+# layout() returns the offset of each part of a chunk within it, and the
+# size of a chunk, for members members and chunkTicks loops per chunk.
+
+def layout(members, chunkTicks):
+    parts={}
+    offset=0
+    for name, dtype, width in (("times", np.float64, 2), \
+                               ("x", np.float32, members), \
+                               ("y", np.float32, members), \
+                               ("codes", np.uint8, members)):
+        parts[name]=(offset, np.dtype(dtype), width)
+        offset+=-(-chunkTicks*width*np.dtype(dtype).itemsize//ALIGN)*ALIGN
+    return parts, offset
+
+# views() returns a dictionary of 2D arrays, one row per loop, viewing the
+# parts of a chunk in buffer.
+
+def views(buffer, parts, chunkTicks):
+    return {name: np.ndarray((chunkTicks, width), dtype, buffer=buffer, \
+                             offset=offset) \
+            for name, (offset, dtype, width) in parts.items()}
+
+# TrajectoryRecorder records a simulation of members members (their ids must
+# all be less than members) to the file at path. params, the parameters of
+# the simulation, are saved for Replay.py to show. Use it in a with
+# statement, or call close() at the end.
+
+class TrajectoryRecorder(Instrumentation.Hooks):
+    def __init__(self, path, members, params=None, chunkTicks=256):
+        self.path=path
+        self.members=members
+        self.chunkTicks=chunkTicks
+        self.parts, self.chunkBytes=layout(members, chunkTicks)
+        header=json.dumps({"version": VERSION, "members": members, \
+                           "chunkTicks": chunkTicks, \
+                           "params": params or {}}).encode()
+        self.start=-(-(len(MAGIC)+12+len(header))//ALIGN)*ALIGN
+        self.file=open(path, "w+b")
+        self.file.write(MAGIC+struct.pack("<QI", 0, len(header))+header)
+        self.file.truncate(self.start)
+        self.ticks=0
+        self.chunk=None
+        self.day=0
+        self.hour=0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # append() records the members of pop at the given time.
+
+    def append(self, pop, day, hour):
+        row=self.ticks%self.chunkTicks
+        if row==0:
+            self.flush()
+            offset=self.start+(self.ticks//self.chunkTicks)*self.chunkBytes
+            self.file.truncate(offset+self.chunkBytes)
+            self.chunk=np.memmap(self.file, dtype=np.uint8, mode="r+", \
+                                 offset=offset, shape=(self.chunkBytes,))
+            self.arrays=views(self.chunk, self.parts, self.chunkTicks)
+        self.arrays["times"][row]=(day, hour)
+        self.arrays["codes"][row]=DEAD
+        self.arrays["codes"][row, pop.ids]=VectorEngine.stateCodes(pop)
+        self.arrays["x"][row, pop.ids]=pop.x
+        self.arrays["y"][row, pop.ids]=pop.y
+        self.ticks+=1
+        if self.ticks%self.chunkTicks==0:
+            self.flush()
+
+    # flush() writes the chunk being filled to disk, and the number of loops
+    # recorded to the file.
+
+    def flush(self):
+        if self.chunk is not None:
+            self.chunk.flush()
+        self.file.seek(len(MAGIC))
+        self.file.write(struct.pack("<Q", self.ticks))
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.chunk=None
+        self.arrays=None
+        self.file.close()
+
+    # after() records pop at the end of every loop, keeping track of the
+    # time like Covid19Simulation.time().
+
+    def after(self, stage, pop, tally):
+        if stage==Instrumentation.STAGES[-1]:
+            self.day, self.hour=Covid19Simulation.time(self.day, \
+                                                       self.hour)
+            self.append(pop, self.day, self.hour)
+
+# Trajectory reads a file written by a TrajectoryRecorder. len() of it is the
+# number of loops recorded when it was opened.
+
+class Trajectory:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC))!=MAGIC:
+                raise ValueError(path+" is not a trajectory file")
+            self.ticks, length=struct.unpack("<QI", f.read(12))
+            header=json.loads(f.read(length))
+        if header["version"]!=VERSION:
+            raise ValueError("unsupported trajectory version "+ \
+                             str(header["version"]))
+        self.members=header["members"]
+        self.chunkTicks=header["chunkTicks"]
+        self.params=header["params"]
+        self.parts, self.chunkBytes=layout(self.members, self.chunkTicks)
+        start=-(-(len(MAGIC)+12+length)//ALIGN)*ALIGN
+        chunks=-(-self.ticks//self.chunkTicks)
+        self.data=np.memmap(path, dtype=np.uint8, mode="r", offset=start, \
+                            shape=(chunks*self.chunkBytes,)) if chunks else \
+                  np.zeros(0, np.uint8)
+
+    def __len__(self):
+        return self.ticks
+
+    # loop() returns the day, hour, x, y, and codes of the members alive at
+    # loop tick (counting from 0).
+
+    def loop(self, tick):
+        if not 0<=tick<self.ticks:
+            raise IndexError("loop "+str(tick)+" was not recorded")
+        chunk, row=divmod(tick, self.chunkTicks)
+        arrays=views(self.data[chunk*self.chunkBytes: \
+                               (chunk+1)*self.chunkBytes], \
+                     self.parts, self.chunkTicks)
+        alive=arrays["codes"][row]!=DEAD
+        day, hour=arrays["times"][row]
+        return int(day), float(hour), arrays["x"][row][alive], \
+               arrays["y"][row][alive], arrays["codes"][row][alive]
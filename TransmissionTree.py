@@ -0,0 +1,231 @@
+# TransmissionTree.py records who infected whom during a simulation, so that
+# the effective reproduction number, generation intervals, and the number of
+# secondary cases can be worked out afterwards. A TransmissionLog is a set of
+# hooks (see Instrumentation.py), passed as hooks to Headless.runHeadless()
+# or VectorEngine.step(). Every loop it appends a row for each member
+# infected: the loop (tick), the id of the member who infected them
+# (infector), their id (infectee), and whether they are vaccinated. With
+# contacts=True, it also appends a row for every pair of members in contact.
+
+# Rows are kept in arrays that double in size when full, and are only ever
+# appended to, in order of tick. The first row of each tick is remembered, so
+# the rows of any range of ticks are found without searching. The counts the
+# queries need are kept up to date as rows are appended: for every infection,
+# the number of members it went on to infect (its secondary cases), and for
+# every day, how many members were infected and how many members they went
+# on to infect. The members infected at the start are logged in tick 0 with
+# an infector of -1.
+
+import numpy as np
+import Instrumentation
+
+#loops in a day
+LOOPS_PER_DAY=48
+
+# Columns holds equally long columns of rows, as NumPy arrays that grow by
+# doubling so that appending is quick.
+
+class Columns:
+    def __init__(self, dtypes, capacity=1024):
+        self.arrays={name: np.zeros(capacity, dtype) for name, dtype in \
+                     dtypes.items()}
+        self.rows=0
+
+    def __len__(self):
+        return self.rows
+
+    # append() adds count rows, taking each column from values.
+
+    def append(self, count, **values):
+        if self.rows+count>len(next(iter(self.arrays.values()))):
+            capacity=max(2*(self.rows+count), 1024)
+            for name, array in self.arrays.items():
+                grown=np.zeros(capacity, array.dtype)
+                grown[:self.rows]=array[:self.rows]
+                self.arrays[name]=grown
+        for name, value in values.items():
+            self.arrays[name][self.rows:self.rows+count]=value
+        self.rows+=count
+
+    # column() returns the filled part of a column, without copying it.
+
+    def column(self, name, start=0, stop=None):
+        stop=self.rows if stop is None else stop
+        return self.arrays[name][start:stop]
+
+# grow() returns array with room for at least size entries, filled with
+# fill, doubling it if it is too short.
+
+def grow(array, size, fill=0):
+    if size<=len(array):
+        return array
+    grown=np.full(max(size, 2*len(array)), fill, array.dtype)
+    grown[:len(array)]=array
+    return grown
+
+# TransmissionLog records the transmissions of a simulation, and answers
+# questions about them.
+
+class TransmissionLog(Instrumentation.Hooks):
+    def __init__(self, contacts=False):
+        self.events=Columns({"tick": np.int32, "infector": np.int64, \
+                             "infectee": np.int64, "vaccinated": bool, \
+                             "secondary": np.int32, "interval": np.int32})
+        self.contacts=Columns({"tick": np.int32, "a": np.int64, \
+                               "b": np.int64}) if contacts else None
+        #first row of events and contacts in each tick
+        self.eventStarts=[]
+        self.contactStarts=[]
+        #row of the current infection of each member, by id
+        self.current=np.full(1024, -1, np.int64)
+        #members infected on each day, and how many members they infected
+        self.infectionsByDay=np.zeros(16, np.int64)
+        self.secondaryByDay=np.zeros(16, np.int64)
+        self.tick=0
+        self.agentIndex=None
+
+    # log() appends the infection of the members with ids infectees by the
+    # members with ids infectors (-1 for the members infected at the start).
+
+    def log(self, infectors, infectees, vaccinated):
+        count=len(infectees)
+        if count==0:
+            return
+        rows=np.arange(len(self.events), len(self.events)+count)
+        self.current=grow(self.current, int(infectees.max())+1, -1)
+        interval=np.full(count, -1, np.int32)
+        known=infectors>=0
+        if known.any():
+            sourceRows=self.current[infectors[known]]
+            sourceTicks=self.events.column("tick")[sourceRows]
+            interval[known]=self.tick-sourceTicks
+            np.add.at(self.events.column("secondary"), sourceRows, 1)
+            days=sourceTicks//LOOPS_PER_DAY
+            self.secondaryByDay=grow(self.secondaryByDay, int(days.max())+1)
+            np.add.at(self.secondaryByDay, days, 1)
+        day=self.tick//LOOPS_PER_DAY
+        self.infectionsByDay=grow(self.infectionsByDay, day+1)
+        self.infectionsByDay[day]+=count
+        self.events.append(count, tick=self.tick, infector=infectors, \
+                           infectee=infectees, vaccinated=vaccinated, \
+                           secondary=0, interval=interval)
+        self.current[infectees]=rows
+        self.agentIndex=None
+
+    def before(self, stage, pop):
+        if stage==Instrumentation.STAGES[0]:
+            self.eventStarts.append(len(self.events))
+            if self.contacts is not None:
+                self.contactStarts.append(len(self.contacts))
+            if self.tick==0:
+                seeds=np.flatnonzero(pop.infected)
+                self.log(np.full(len(seeds), -1, np.int64), pop.ids[seeds], \
+                         pop.vaccStatus[seeds])
+
+    def after(self, stage, pop, tally):
+        if stage=="checkCollisions" and self.contacts is not None:
+            rows, cols=tally["contacts"]
+            self.contacts.append(len(rows), tick=self.tick, a=pop.ids[rows], \
+                                 b=pop.ids[cols])
+        elif stage=="updateStatus":
+            infected=tally["infected"]
+            self.log(pop.ids[tally["infectors"]], pop.ids[infected], \
+                     pop.vaccStatus[infected])
+        elif stage==Instrumentation.STAGES[-1]:
+            self.tick+=1
+
+    # rows() returns the first and last row of columns in the ticks from
+    # start up to but not including stop.
+
+    def rows(self, columns, starts, start=0, stop=None):
+        stop=len(starts) if stop is None else min(stop, len(starts))
+        start=min(max(start, 0), stop)
+        first=starts[start] if start<len(starts) else len(columns)
+        last=starts[stop] if stop<len(starts) else len(columns)
+        return first, last
+
+    # transmissions() returns the columns of the infections in the ticks
+    # from start up to but not including stop, as a dictionary of arrays.
+
+    def transmissions(self, start=0, stop=None):
+        first, last=self.rows(self.events, self.eventStarts, start, stop)
+        return {name: self.events.column(name, first, last) for name in \
+                ("tick", "infector", "infectee", "vaccinated", "secondary")}
+
+    # contactsIn() returns the ticks and the ids of both members of every
+    # contact in the ticks from start up to but not including stop.
+
+    def contactsIn(self, start=0, stop=None):
+        if self.contacts is None:
+            raise ValueError("contacts were not recorded")
+        first, last=self.rows(self.contacts, self.contactStarts, start, stop)
+        return {name: self.contacts.column(name, first, last) for name in \
+                ("tick", "a", "b")}
+
+    # byAgent() returns the rows of the infections of the member with id
+    # agent, and of the infections they caused. The index this uses is
+    # built the first time it is needed after new rows are appended.
+
+    def byAgent(self, agent):
+        if self.agentIndex is None:
+            infectees=self.events.column("infectee")
+            infectors=self.events.column("infector")
+            byInfectee=np.argsort(infectees, kind="stable")
+            byInfector=np.argsort(infectors, kind="stable")
+            self.agentIndex=(byInfectee, infectees[byInfectee], \
+                             byInfector, infectors[byInfector])
+        byInfectee, infectees, byInfector, infectors=self.agentIndex
+        infections=byInfectee[np.searchsorted(infectees, agent): \
+                              np.searchsorted(infectees, agent, "right")]
+        caused=byInfector[np.searchsorted(infectors, agent): \
+                          np.searchsorted(infectors, agent, "right")]
+        return {"infections": {name: self.events.column(name)[infections] \
+                               for name in ("tick", "infector", "secondary")},
+                "caused": {name: self.events.column(name)[caused] for name \
+                           in ("tick", "infectee")}}
+
+    # reproductionNumber() returns, for every day so far, the average number
+    # of members infected by each member who was infected on that day (the
+    # case reproduction number), and the number of members infected that
+    # day. Days with no infections have a reproduction number of NaN. The
+    # members infected on the last days may still infect others, so their
+    # numbers can still grow.
+
+    def reproductionNumber(self):
+        days=self.tick//LOOPS_PER_DAY+1
+        infections=self.infectionsByDay[:days]
+        secondary=self.secondaryByDay[:days]
+        infections=np.pad(infections, (0, days-len(infections)))
+        secondary=np.pad(secondary, (0, days-len(secondary)))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            number=np.where(infections>0, secondary/infections, np.nan)
+        return number, infections
+
+    # generationIntervals() returns the number of loops between a member
+    # being infected and infecting someone else, for every infection in the
+    # ticks from start up to but not including stop.
+
+    def generationIntervals(self, start=0, stop=None):
+        first, last=self.rows(self.events, self.eventStarts, start, stop)
+        interval=self.events.column("interval", first, last)
+        return interval[interval>=0]
+
+    # secondaryCases() returns how many of the infections in the ticks from
+    # start up to but not including stop led to 0, 1, 2, ... other
+    # infections.
+
+    def secondaryCases(self, start=0, stop=None):
+        first, last=self.rows(self.events, self.eventStarts, start, stop)
+        return np.bincount(self.events.column("secondary", first, last))
+
+    # save() writes the log to an .npz file.
+
+    def save(self, path):
+        arrays={"event_"+name: self.events.column(name) for name in \
+                self.events.arrays}
+        arrays["eventStarts"]=np.array(self.eventStarts, np.int64)
+        if self.contacts is not None:
+            arrays.update({"contact_"+name: self.contacts.column(name) \
+                           for name in self.contacts.arrays})
+            arrays["contactStarts"]=np.array(self.contactStarts, np.int64)
+        np.savez(path, **arrays)
@@ -0,0 +1,580 @@
+# VectorEngine.py runs the same model as Covid19Simulation.py, but instead of
+# storing the population as a 2D list, each characteristic of the members is
+# stored in its own NumPy array. Every stage of a loop of the simulation
+# (moving, checking collisions, spreading the infection, and updating
+# infections) is then done on the whole population at once instead of one
+# member at a time, which lets the simulation run with far larger populations.
+
+# The order of the stages in a loop, the size of the box, and the number of
+# loops before a member is contagious or can recover are all the same as in
+# Covid19Simulation.py, and infections end in the same way (see
+# updateInfec()), so both versions give the same epidemiological results.
+# Pairs of members in contact bounce in the same order too, with the same
+# result as bouncing them one pair at a time (see resolveCollisions()). The
+# one difference is the bounce itself: the list version uses collide() from
+# the ElasticCollision module, while this version uses its own collide().
+
+import math
+import numpy as np
+import CounterRNG
+import Instrumentation
+
+#distance between the centers of two members for them to be in contact
+CONTACT=10+0.0001
+#timeSinceInfection after which a member is contagious
+CONTAGIOUS=240
+#timeSinceInfection after which a member can die or recover
+RECOVERY=480
+#hooks step() calls when it is given none, which do nothing
+NO_HOOKS=Instrumentation.Hooks()
+
+# Population stores the members of a population as parallel arrays. Index i
+# of every array describes the same member, just like row i of members does
+# in Covid19Simulation.py. ids gives every member a number that stays the same
+# when other members die and are removed from the arrays.
+
+class Population:
+    def __init__(self, x, y, dx, dy, infected, timeSinceInfection, \
+                 vaccStatus, immune, ids=None):
+        self.x=np.asarray(x, dtype=np.float64)
+        self.y=np.asarray(y, dtype=np.float64)
+        self.dx=np.asarray(dx, dtype=np.float64)
+        self.dy=np.asarray(dy, dtype=np.float64)
+        self.infected=np.asarray(infected, dtype=bool)
+        self.timeSinceInfection=np.asarray(timeSinceInfection, \
+                                           dtype=np.float64)
+        self.vaccStatus=np.asarray(vaccStatus, dtype=bool)
+        self.immune=np.asarray(immune, dtype=bool)
+        #number the members in order if they were not given numbers
+        if ids is None:
+            ids=np.arange(len(self.x))
+        self.ids=np.asarray(ids, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.x)
+
+    # keep() removes every member whose entry in mask is False.
+
+    def keep(self, mask):
+        for name in FIELDS:
+            setattr(self, name, getattr(self, name)[mask])
+
+    # copy() returns a new Population with copies of every array.
+
+    def copy(self):
+        return Population(*[getattr(self, name).copy() for name in FIELDS])
+
+#names of the arrays of a Population, in the order of the columns of members
+FIELDS=("x", "y", "dx", "dy", "infected", "timeSinceInfection", \
+        "vaccStatus", "immune", "ids")
+
+# population() creates a Population of numPop members in the same way as
+# population() in Covid19Simulation.py: members are spread randomly over the
+# box and move in random directions, int(infecRate*numPop) of them are
+# infected, and int(vaccRate/100*numPop) of them are vaccinated. If rng is a
+# CounterRNG.KeyedRandom, the numbers of each member are keyed by its id, and
+# the members infected and vaccinated are those with the smallest keyed
+# numbers.
+
+def population(numPop, infecRate, vaccRate, rng):
+    if CounterRNG.isKeyed(rng):
+        return keyedPopulation(numPop, infecRate, vaccRate, rng)
+    x=rng.random(numPop)*500
+    y=rng.uniform(20, 512, numPop)
+    angle=rng.uniform(0, 2*math.pi, numPop)
+    infected=np.zeros(numPop, dtype=bool)
+    infected[rng.choice(numPop, int(infecRate*numPop), replace=False)]=True
+    vaccStatus=np.zeros(numPop, dtype=bool)
+    vaccStatus[rng.choice(numPop, int((vaccRate/100)*numPop), \
+                          replace=False)]=True
+    return Population(x, y, np.cos(angle), np.sin(angle), infected, \
+                      np.zeros(numPop), vaccStatus, np.zeros(numPop, bool))
+
+def keyedPopulation(numPop, infecRate, vaccRate, rng):
+    ids=np.arange(numPop)
+    x=rng.uniform(CounterRNG.X, ids)*500
+    y=20+rng.uniform(CounterRNG.Y, ids)*492
+    angle=rng.uniform(CounterRNG.ANGLE, ids)*2*math.pi
+    infected=np.zeros(numPop, dtype=bool)
+    chosen=np.argsort(rng.uniform(CounterRNG.INFECTED, ids), kind="stable")
+    infected[chosen[:int(infecRate*numPop)]]=True
+    vaccStatus=np.zeros(numPop, dtype=bool)
+    chosen=np.argsort(rng.uniform(CounterRNG.VACCINATED, ids), kind="stable")
+    vaccStatus[chosen[:int((vaccRate/100)*numPop)]]=True
+    return Population(x, y, np.cos(angle), np.sin(angle), infected, \
+                      np.zeros(numPop), vaccStatus, np.zeros(numPop, bool))
+
+# fromMembers() converts the 2D list returned by population() in
+# Covid19Simulation.py into a Population.
+
+def fromMembers(members):
+    columns=list(zip(*members)) if members else [()]*8
+    return Population(*columns)
+
+# toMembers() converts a Population back into a 2D list of members.
+
+def toMembers(pop):
+    return [[float(pop.x[i]), float(pop.y[i]), float(pop.dx[i]), \
+             float(pop.dy[i]), bool(pop.infected[i]), \
+             float(pop.timeSinceInfection[i]), bool(pop.vaccStatus[i]), \
+             bool(pop.immune[i])] for i in range(len(pop))]
+
+# advanceInfection() increments timeSinceInfection of every infected member
+# by 0.5, because each loop represents 0.5 hours.
+
+def advanceInfection(pop):
+    pop.timeSinceInfection[pop.infected]+=0.5
+
+# movePeople() moves every member by its trajectory and reflects the members
+# that hit a side of the box. Like the list version, a member only reflects
+# off one side per loop, checked in the order right, left, bottom, top.
+
+def movePeople(pop):
+    pop.x+=pop.dx
+    pop.y+=pop.dy
+
+    right=pop.x>=502
+    left=~right & (pop.x<=0)
+    bottom=~right & ~left & (pop.y>=502)
+    top=~right & ~left & ~bottom & (pop.y<21)
+
+    pop.dx[right | left]*=-1
+    pop.x[right]-=1
+    pop.x[left]+=1
+    pop.dy[bottom | top]*=-1
+    pop.y[bottom]-=1
+    pop.y[top]+=1
+
+# findContacts() returns two arrays, rows and cols, such that member rows[k]
+# and member cols[k] are in contact, with rows[k] < cols[k]. The pairs are in
+# the same order that checkCollisions() in Covid19Simulation.py finds them.
+# Like findContacts() in Covid19Simulation.py, the box is divided into cells
+# as wide as the contact distance and each member is only compared with the
+# members of its own cell and 4 of the neighboring cells, so the time taken
+# grows with the population size instead of its square. A different distance
+# finds the pairs of members at most that far apart instead.
+
+def findContacts(pop, distance=CONTACT):
+    n=len(pop)
+    if n<2:
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    cellX=np.floor(pop.x/distance).astype(np.int64)
+    cellY=np.floor(pop.y/distance).astype(np.int64)
+    #leave an empty row of cells on each side so neighbors never wrap around
+    cellX-=cellX.min()-1
+    cellY-=cellY.min()-1
+    height=int(cellY.max())+2
+    cell=cellX*height+cellY
+
+    #sort the members by cell, so that each cell is one run of members
+    order=np.argsort(cell, kind="stable")
+    sortedCell=cell[order]
+
+    rows=[]
+    cols=[]
+    for nextX, nextY in ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1)):
+        other=cell+nextX*height+nextY
+        start=np.searchsorted(sortedCell, other, side="left")
+        stop=np.searchsorted(sortedCell, other, side="right")
+        counts=stop-start
+        #pair each member with every member of the other cell
+        a=np.repeat(np.arange(n), counts)
+        first=np.repeat(start-np.cumsum(counts)+counts, counts)
+        b=order[np.arange(len(a))+first]
+        if nextX==0 and nextY==0:
+            #within the same cell, only keep each pair once
+            keep=a<b
+            a=a[keep]
+            b=b[keep]
+        near=(pop.x[a]-pop.x[b])**2+(pop.y[a]-pop.y[b])**2<=distance**2
+        rows.append(np.minimum(a[near], b[near]))
+        cols.append(np.maximum(a[near], b[near]))
+    rows=np.concatenate(rows)
+    cols=np.concatenate(cols)
+    order=np.lexsort((cols, rows))
+    return rows[order], cols[order]
+
+# collide() bounces two members off each other. The members have the same
+# mass, so in an elastic collision they swap the parts of their trajectories
+# that point along the line between their centers. Members that are already
+# moving apart are left alone so that they do not stick together.
+
+def collide(pop, a, b):
+    normX=pop.x[b]-pop.x[a]
+    normY=pop.y[b]-pop.y[a]
+    dist=math.hypot(normX, normY)
+    if dist==0:
+        return
+    normX/=dist
+    normY/=dist
+    #speed at which a moves towards b
+    closing=(pop.dx[a]-pop.dx[b])*normX+(pop.dy[a]-pop.dy[b])*normY
+    if closing>0:
+        pop.dx[a]-=closing*normX
+        pop.dy[a]-=closing*normY
+        pop.dx[b]+=closing*normX
+        pop.dy[b]+=closing*normY
+
+# resolveCollisions() bounces every pair of members in contact off each
+# other, with the bounce collide() gives. Bouncing the pairs one at a time in
+# order is slow, but bouncing them all at once from the trajectories at the
+# start of the loop gives a member in several contacts a full bounce from
+# each of them, which adds or removes energy. Instead, the pairs are bounced
+# in rounds: a pair is bounced in the round after the earlier pairs of both
+# of its members have been, so no member is in two pairs of the same round,
+# and each round is bounced all at once. A member in a single contact gets
+# exactly the bounce collide() would give it, and every bounce keeps both the
+# momentum and the energy of the pair the same. Since each pair is bounced
+# after the earlier pairs of its members, the result is the same as calling
+# collide() on each pair in order.
+
+# Each pair waits for at most two others: the pair before it in the list of
+# pairs of each of its members. The lists are worked out once, and each
+# round only looks at the pairs that were waiting for the round before it,
+# so the work done is proportional to the number of pairs however many
+# rounds there are.
+
+def resolveCollisions(pop, rows, cols):
+    pairs=len(rows)
+    if pairs==0:
+        return
+    #list the pairs of each member in order; entry e is pair e%pairs, and
+    #sorting by member and then pair is one sort of a combined number
+    members=np.concatenate((rows, cols))
+    entries=np.argsort(members.astype(np.int64)*pairs+ \
+                       np.tile(np.arange(pairs), 2))
+    listed=entries%pairs
+    same=members[entries[1:]]==members[entries[:-1]]
+    #the pair after each entry in its member's list, or -1
+    after=np.full(2*pairs, -1)
+    after[entries[:-1][same]]=listed[1:][same]
+    waiting=np.bincount(listed[1:][same], minlength=pairs)
+    slot=np.empty(pairs, dtype=np.int64)
+
+    now=np.flatnonzero(waiting==0)
+    while len(now):
+        a=rows[now]
+        b=cols[now]
+        normX=pop.x[b]-pop.x[a]
+        normY=pop.y[b]-pop.y[a]
+        dist=np.hypot(normX, normY)
+        apart=dist>0
+        normX=np.divide(normX, dist, out=np.zeros_like(normX), where=apart)
+        normY=np.divide(normY, dist, out=np.zeros_like(normY), where=apart)
+        #speed at which a moves towards b; members moving apart are left alone
+        closing=(pop.dx[a]-pop.dx[b])*normX+(pop.dy[a]-pop.dy[b])*normY
+        closing=np.maximum(closing, 0)
+        pop.dx[a]-=closing*normX
+        pop.dy[a]-=closing*normY
+        pop.dx[b]+=closing*normX
+        pop.dy[b]+=closing*normY
+
+        #the pairs that were waiting for these can go once nothing is left
+        #to wait for
+        next=np.concatenate((after[now], after[now+pairs]))
+        next=next[next>=0]
+        np.subtract.at(waiting, next, 1)
+        now=next[waiting[next]==0]
+        #a pair that was waiting for two of these is listed twice
+        slot[now]=np.arange(len(now))
+        now=now[slot[now]==np.arange(len(now))]
+
+# bounceLocal() bounces pairs of members in contact off each other in a way
+# that does not depend on the order of the pairs. Each member picks the
+# member it is moving towards fastest (the one with the lowest id if there is
+# a tie), and two members who pick each other bounce exactly as collide()
+# makes them. No member is in two of these pairs, so every bounce keeps both
+# the momentum and the energy of the pair the same. Unlike
+# resolveCollisions(), a member moving towards several others in the same
+# loop only bounces off one of them, and off the others in later loops if it
+# is still moving towards them. Whether a member bounces only depends on the
+# members within twice the contact distance of it, which lets
+# DomainDecomposition.py bounce the members of a tile knowing only the
+# members of its neighbors near the edge.
+
+def bounceLocal(pop, rows, cols):
+    if len(rows)==0:
+        return
+    normX=pop.x[cols]-pop.x[rows]
+    normY=pop.y[cols]-pop.y[rows]
+    dist=np.hypot(normX, normY)
+    apart=dist>0
+    normX=np.divide(normX, dist, out=np.zeros_like(normX), where=apart)
+    normY=np.divide(normY, dist, out=np.zeros_like(normY), where=apart)
+    #speed at which each first member moves towards the second
+    closing=(pop.dx[rows]-pop.dx[cols])*normX+ \
+            (pop.dy[rows]-pop.dy[cols])*normY
+    pairs=np.flatnonzero(closing>0)
+    if len(pairs)==0:
+        return
+
+    #list the pairs of each member, fastest first, and pick the first one
+    members=np.concatenate((rows[pairs], cols[pairs]))
+    partners=np.concatenate((pop.ids[cols[pairs]], pop.ids[rows[pairs]]))
+    speeds=np.tile(closing[pairs], 2)
+    entries=np.lexsort((partners, -speeds, members))
+    first=np.r_[True, members[entries[1:]]!=members[entries[:-1]]]
+    picked=np.full(len(pop), -1)
+    picked[members[entries[first]]]=np.tile(pairs, 2)[entries[first]]
+    pairs=pairs[(picked[rows[pairs]]==pairs) & (picked[cols[pairs]]==pairs)]
+
+    a=rows[pairs]
+    b=cols[pairs]
+    pop.dx[a]-=closing[pairs]*normX[pairs]
+    pop.dy[a]-=closing[pairs]*normY[pairs]
+    pop.dx[b]+=closing[pairs]*normX[pairs]
+    pop.dy[b]+=closing[pairs]*normY[pairs]
+
+# checkCollisions() finds every pair of members in contact and bounces them
+# off each other with resolveCollisions(), or with bounceLocal() if local is
+# True. Returns the pairs as a tuple of two arrays. If tally is a
+# dictionary, the number of pairs is stored in it under "pairs", and the
+# pairs themselves under "contacts".
+
+def checkCollisions(pop, tally=None, local=False):
+    rows, cols=findContacts(pop)
+    if local:
+        bounceLocal(pop, rows, cols)
+    elif len(rows):
+        resolveCollisions(pop, rows, cols)
+    if tally is not None:
+        tally["pairs"]=len(rows)
+        tally["contacts"]=(rows, cols)
+    return rows, cols
+
+# transmit() is the part of updateStatus() that decides which members are
+# infected, working only on arrays so that the random numbers can be drawn
+# beforehand. rows and cols are the pairs of members in contact, infected,
+# timeSinceInfection, immune, and vaccStatus are the arrays of a Population,
+# and uniforms holds one random number between 0 and 1 for each pair.
+# In each pair, the virus can only spread one way: from a contagious member
+# to a member who is neither infected nor immune. A member who is not
+# vaccinated is infected if the pair's number is at most transmissionRate. A
+# vaccinated member is only infected if the vaccine fails, with probability
+# 1-vaccEffective, and the virus is transmitted, so the number must be at
+# most (1-vaccEffective)*transmissionRate. The rates are fractions here, not
+# percentages. Returns the indices of the members infected (each only once)
+# and the number of pairs in which the virus could spread. With sources=True,
+# the indices of the members who infected them are returned in between: the
+# contagious member of the first pair in which each member was infected, as
+# in the list version, where later pairs find the member already infected.
+# contagious can give whether each member is contagious, such as the flags
+# kept by an EventScheduler.InfectionScheduler; otherwise it is worked out
+# from timeSinceInfection.
+
+def transmit(rows, cols, infected, timeSinceInfection, immune, vaccStatus, \
+             transmissionRate, vaccEffective, uniforms, sources=False, \
+             contagious=None):
+    if contagious is None:
+        contagious=infected & (timeSinceInfection>=CONTAGIOUS)
+    susceptible=~infected & ~immune
+
+    #work out which way the virus can spread in each pair
+    forward=contagious[rows] & susceptible[cols]
+    backward=contagious[cols] & susceptible[rows]
+    attempt=forward | backward
+    targets=np.where(forward, cols, rows)[attempt]
+
+    chance=np.where(vaccStatus[targets], (1-vaccEffective)*transmissionRate, \
+                    transmissionRate)
+    success=uniforms[attempt]<=chance
+    if not sources:
+        return np.unique(targets[success]), len(targets)
+    infectors=np.where(forward, rows, cols)[attempt][success]
+    newlyInfected, first=np.unique(targets[success], return_index=True)
+    return newlyInfected, infectors[first], len(targets)
+
+# updateStatus() assesses, for every pair of members in contact, if the
+# infection spreads from a contagious member to a member who is neither
+# infected nor immune, using transmit() with one random number drawn for
+# every pair (keyed by both members' ids if rng is a CounterRNG.KeyedRandom).
+# A member in contact with several contagious members gets one chance of
+# being infected per contact. Returns the indices of the members
+# who were infected. If tally is a dictionary, the number of contacts in
+# which the virus could spread and the number of members infected are stored
+# in it under "attempts" and "newInfections", and the indices of the members
+# infected and of who infected each of them under "infected" and
+# "infectors". contagious is passed on to transmit().
+
+def updateStatus(collisions, pop, transmissionRate, vaccEffective, rng, \
+                 tally=None, contagious=None):
+    rows, cols=collisions
+    if CounterRNG.isKeyed(rng):
+        uniforms=rng.uniform(CounterRNG.TRANSMIT, pop.ids[rows], pop.ids[cols])
+    else:
+        uniforms=rng.random(len(rows))
+    if tally is None:
+        infected, attempts=transmit(rows, cols, pop.infected, \
+                                    pop.timeSinceInfection, pop.immune, \
+                                    pop.vaccStatus, transmissionRate/100, \
+                                    vaccEffective/100, uniforms, False, \
+                                    contagious)
+    else:
+        infected, infectors, attempts=transmit( \
+            rows, cols, pop.infected, pop.timeSinceInfection, pop.immune, \
+            pop.vaccStatus, transmissionRate/100, vaccEffective/100, \
+            uniforms, True, contagious)
+        tally["attempts"]=attempts
+        tally["newInfections"]=len(infected)
+        tally["infected"]=infected
+        tally["infectors"]=infectors
+    pop.infected[infected]=True
+    return infected
+
+# skippedAfterDeath() returns which of the members at eligible the list
+# version never looks at. It removes a member who dies from the list while
+# looping over it, so the loop skips the member right after each one who
+# dies. A member who is skipped does not die, so the member after it is
+# looked at again. dies gives whether each member at eligible would die if it
+# were looked at.
+
+def skippedAfterDeath(eligible, dies):
+    dying=eligible[dies]
+    if len(dying)==0:
+        return np.zeros(len(eligible), dtype=bool)
+    #in a run of members next to each other who would all die, every second
+    #one is skipped
+    first=np.r_[True, np.diff(dying)!=1]
+    runs=np.cumsum(first)-1
+    died=dying[(np.arange(len(dying))-np.flatnonzero(first)[runs])%2==0]
+    return np.isin(eligible, died+1)
+
+# updateInfec() decides, for every member who has been infected for twenty
+# days, if they die, recover, or stay infected, and removes the members who
+# die. The list version stops looking at members as soon as it finds one
+# that neither dies nor recovers, so only the members before that one can
+# change status in a loop, and it skips the member after each one who dies
+# (see skippedAfterDeath()); this does the same so the results match. With
+# ordered=False every member gets the same chances instead, whatever the
+# order of the members. Returns the new population size. If tally is a
+# dictionary, the number of members who died and who recovered are stored in
+# it under "deaths" and "recoveries".
+
+def updateInfec(pop, deathRate, immunityRate, rng, tally=None, ordered=True):
+    immunityRate=immunityRate/100
+    eligible=np.flatnonzero(pop.timeSinceInfection>=RECOVERY)
+    if CounterRNG.isKeyed(rng):
+        x=rng.uniform(CounterRNG.OUTCOME, pop.ids[eligible])
+        stay=rng.uniform(CounterRNG.STAYS, pop.ids[eligible])
+    else:
+        x=rng.random(len(eligible))
+        stay=rng.random(len(eligible))
+    dies=x*.01<=deathRate
+    stays=~dies & (stay>.20)
+    if not ordered:
+        eligible=eligible[~stays]
+        x=x[~stays]
+        dies=dies[~stays]
+    else:
+        looked=~skippedAfterDeath(eligible, dies)
+        stays&=looked
+        if stays.any():
+            stop=int(np.argmax(stays))
+            looked[stop:]=False
+        eligible=eligible[looked]
+        x=x[looked]
+        dies=dies[looked]
+
+    #members who recover, and whether they develop antibodies
+    recovered=eligible[~dies]
+    pop.immune[recovered[x[~dies]<=immunityRate]]=True
+    pop.infected[recovered]=False
+    pop.timeSinceInfection[recovered]=0
+
+    deaths=int(np.count_nonzero(dies))
+    if deaths:
+        alive=np.ones(len(pop), dtype=bool)
+        alive[eligible[dies]]=False
+        pop.keep(alive)
+    if tally is not None:
+        tally["deaths"]=deaths
+        tally["recoveries"]=len(recovered)
+    return len(pop)
+
+# countHealthy() returns the number of members who are not infected and the
+# updated infecRate, like countHealthy() in Covid19Simulation.py.
+
+def countHealthy(pop):
+    if len(pop)==0:
+        return 0, 0.0
+    infec=int(np.count_nonzero(pop.infected))
+    return len(pop)-infec, infec/len(pop)
+
+# countStates() returns how many members are drawn in each color by
+# drawPeople() in Covid19Simulation.py: contagious (red), infected but not
+# contagious (orange), healthy (green), and immune (purple).
+
+def countStates(pop):
+    incubating=pop.infected & (pop.timeSinceInfection<=CONTAGIOUS)
+    infec=int(np.count_nonzero(pop.infected))
+    incub=int(np.count_nonzero(incubating))
+    immune=int(np.count_nonzero(~pop.infected & pop.immune))
+    return infec-incub, incub, len(pop)-infec-immune, immune
+
+#codes returned by stateCodes(), in the order of countStates()
+CONTAGIOUS_CODE=0
+INCUBATING_CODE=1
+HEALTHY_CODE=2
+IMMUNE_CODE=3
+
+# stateCodes() returns an array with the code of the color each member is
+# drawn in by drawPeople() in Covid19Simulation.py.
+
+def stateCodes(pop):
+    codes=np.full(len(pop), HEALTHY_CODE, dtype=np.uint8)
+    codes[pop.immune]=IMMUNE_CODE
+    codes[pop.infected]=CONTAGIOUS_CODE
+    codes[pop.infected & (pop.timeSinceInfection<=CONTAGIOUS)]=INCUBATING_CODE
+    return codes
+
+# step() runs one loop (0.5 hours) of the simulation on pop, in the same
+# order as main() in Covid19Simulation.py. Returns the number of healthy
+# members and the updated infecRate. If tally is a dictionary, the counts
+# stored by each stage (see checkCollisions(), updateStatus(), and
+# updateInfec()) are stored in it. hooks is an object whose before() and
+# after() methods are called around each stage (see Instrumentation.py);
+# without hooks, the do-nothing NO_HOOKS are called, and no tally is kept
+# unless one is given. If scheduler is an
+# EventScheduler.InfectionScheduler, it decides which members are contagious
+# and when infected members die or recover instead of updateInfec(), and
+# deathRate and immunityRate are ignored in favor of the ones it was created
+# with. If rng is a CounterRNG.KeyedRandom, members bounce with
+# bounceLocal() and infections end with updateInfec(ordered=False), so that
+# nothing depends on the order of the members, and its tick is advanced at
+# the end of the loop. This is a different contact model from the default
+# one: members moving towards several others only bounce off one of them per
+# loop, so they stay in contact for longer. With 2000 members over 400 loops,
+# there were about 1200 pairs in contact per loop instead of about 915, so
+# the virus also spreads faster.
+
+def step(pop, transmissionRate, vaccEffective, deathRate, immunityRate, rng, \
+         tally=None, hooks=None, scheduler=None):
+    keyed=CounterRNG.isKeyed(rng)
+    if hooks is None:
+        hooks=NO_HOOKS
+    elif tally is None:
+        tally={}
+    advanceInfection(pop)
+    contagious=None
+    if scheduler is not None:
+        contagious=scheduler.updateContagious(pop, tally)
+    hooks.before("movePeople", pop)
+    movePeople(pop)
+    hooks.after("movePeople", pop, tally)
+    hooks.before("checkCollisions", pop)
+    collisions=checkCollisions(pop, tally, keyed)
+    hooks.after("checkCollisions", pop, tally)
+    hooks.before("updateStatus", pop)
+    infected=updateStatus(collisions, pop, transmissionRate, vaccEffective, \
+                          rng, tally, contagious)
+    hooks.after("updateStatus", pop, tally)
+    hooks.before("updateInfec", pop)
+    if scheduler is None:
+        updateInfec(pop, deathRate, immunityRate, rng, tally, not keyed)
+    else:
+        scheduler.infect(pop.ids[infected], rng)
+        scheduler.updateInfec(pop, rng, tally)
+    hooks.after("updateInfec", pop, tally)
+    if keyed:
+        rng.tick+=1
+    return countHealthy(pop)
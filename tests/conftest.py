@@ -0,0 +1,42 @@
+# conftest.py lets the tests import the modules of the simulation, which sit
+# at the top of the repository rather than in a package, and gives the tests
+# of the list model a stand-in for the ElasticCollision module, which is not
+# part of the repository.
+
+import os
+import sys
+import math
+import types
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Covid19Simulation as sim
+
+# collide() bounces two rows of members off each other with the same bounce
+# as VectorEngine.collide(), so that the list model can be compared with the
+# vector engine.
+
+def collide(p, q):
+    normX=q[0]-p[0]
+    normY=q[1]-p[1]
+    dist=math.hypot(normX, normY)
+    if dist==0:
+        return
+    normX/=dist
+    normY/=dist
+    closing=(p[2]-q[2])*normX+(p[3]-q[3])*normY
+    if closing>0:
+        p[2]-=closing*normX
+        p[3]-=closing*normY
+        q[2]+=closing*normX
+        q[3]+=closing*normY
+
+# elasticCollision replaces the ElasticCollision module used by
+# Covid19Simulation.checkCollisions() for the length of a test.
+
+@pytest.fixture
+def elasticCollision(monkeypatch):
+    stub=types.SimpleNamespace(collide=collide)
+    monkeypatch.setattr(sim, "ElasticCollision", stub)
+    return stub
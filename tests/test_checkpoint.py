@@ -0,0 +1,23 @@
+# test_checkpoint.py checks that a simulation continued from a checkpoint
+# gives exactly the same results as if it had never stopped.
+
+import numpy as np
+import pytest
+import Checkpoint
+import Headless
+import VectorEngine
+
+@pytest.mark.parametrize("keyed", (False, True))
+@pytest.mark.parametrize("mmap", (False, True))
+def testResumeMatchesUninterruptedRun(tmp_path, keyed, mmap):
+    path=str(tmp_path/"checkpoint-{loop}.c19")
+    day, hour, pop, series=Headless.runHeadless(numPop=300, seed=7, \
+                                                maxLoops=200, keyed=keyed, \
+                                                checkpointEvery=80, \
+                                                checkpointPath=path)
+    resumed=Checkpoint.resume(path.format(loop=80), maxLoops=200, mmap=mmap)
+    assert resumed[:2]==(day, hour)
+    for name in VectorEngine.FIELDS:
+        assert np.array_equal(getattr(resumed[2], name), getattr(pop, name))
+    for name in series:
+        assert resumed[3][name]==series[name][80:]
@@ -0,0 +1,28 @@
+# test_decomposition.py checks that a simulation with keyed random numbers
+# gives exactly the same results whether it runs in one process or is split
+# into tiles by DomainDecomposition.py.
+
+import numpy as np
+import pytest
+import CounterRNG
+import DomainDecomposition
+import Headless
+import VectorEngine
+
+PARAMS={"transmissionRate": 10.0, "vaccEffective": 50.0, \
+        "deathRate": 0.00026, "immunityRate": 50.0}
+
+@pytest.mark.parametrize("tiles", (1, 2, 5))
+def testDecomposedMatchesSerial(tiles):
+    day, hour, serial, series=Headless.runHeadless(numPop=400, seed=3, \
+                                                   maxLoops=120, keyed=True)
+    pop=VectorEngine.population(400, 0.50, 10.0, CounterRNG.KeyedRandom(3))
+    result=DomainDecomposition.runDecomposed(pop, PARAMS, tiles, seed=3, \
+                                             maxLoops=120, keyed=True)
+    assert result[:2]==(day, hour)
+    assert result[3]==series
+    decomposed=result[2]
+    serial.keep(np.argsort(serial.ids))
+    decomposed.keep(np.argsort(decomposed.ids))
+    for name in VectorEngine.FIELDS:
+        assert np.array_equal(getattr(decomposed, name), getattr(serial, name))
@@ -0,0 +1,133 @@
+# test_vector_engine.py checks that the functions of VectorEngine.py give the
+# same results as the list model in Covid19Simulation.py, and as the slow
+# ways of doing the same thing that they replace.
+
+import numpy as np
+import pytest
+import Covid19Simulation as sim
+import VectorEngine
+
+# Member is a row of members that remembers which member it is, and makes it
+# the current member whenever its timeSinceInfection is looked at, which the
+# list version of updateInfec() does first for every member it looks at.
+
+class Member(list):
+    current=None
+
+    def __init__(self, number, row):
+        super().__init__(row)
+        self.number=number
+
+    def __getitem__(self, index):
+        if index==5:
+            Member.current=self.number
+            Member.drawn=0
+        return super().__getitem__(index)
+
+# FixedDraws hands out the same random numbers to every member, whichever
+# version of updateInfec() asks for them: draws[0] is the number each member
+# is given first, and draws[1] the number given second. random() is used in
+# place of random.random() by the list version, and a FixedDraws is passed as
+# rng to the vector version.
+
+class FixedDraws:
+    def __init__(self, draws, ids):
+        self.draws=draws
+        self.ids=ids
+        self.calls=0
+
+    def random(self, size=None):
+        if size is None:
+            value=self.draws[Member.drawn][Member.current]
+            Member.drawn+=1
+            return value
+        #the vector version asks for the numbers of every member it looks at
+        #at once, first and then second
+        values=self.draws[self.calls][self.ids]
+        self.calls+=1
+        return values
+
+# randomMembers() returns a 2D list of numPop members at random places in a
+# box of the given size, about half of whom have been infected long enough
+# to die or recover.
+
+def randomMembers(rng, numPop, size=500):
+    return [[float(rng.random()*size), float(rng.random()*size), \
+             float(rng.uniform(-1, 1)), float(rng.uniform(-1, 1)), True, \
+             float(rng.choice((0, 300, 480, 600))), bool(rng.random()<.1), \
+             False] for row in range(numPop)]
+
+def testUpdateInfecMatchesList(monkeypatch):
+    for case in range(3000):
+        rng=np.random.default_rng(case)
+        numPop=int(rng.integers(1, 30))
+        rows=randomMembers(rng, numPop)
+        deathRate=float(rng.choice((0.0, 0.001, 0.003, 0.008)))
+        immunityRate=50.0
+        draws=rng.random((2, numPop))
+
+        members=[Member(i, row) for i, row in enumerate(rows)]
+        monkeypatch.setattr(sim.random, "random", \
+                            FixedDraws(draws, None).random)
+        numLeft=sim.updateInfec(members, deathRate, numPop, immunityRate)
+        monkeypatch.undo()
+
+        pop=VectorEngine.fromMembers(rows)
+        eligible=np.flatnonzero(pop.timeSinceInfection>=VectorEngine.RECOVERY)
+        VectorEngine.updateInfec(pop, deathRate, immunityRate, \
+                                 FixedDraws(draws, pop.ids[eligible]))
+
+        assert len(pop)==numLeft, case
+        assert pop.ids.tolist()==[p.number for p in members], case
+        assert VectorEngine.toMembers(pop)==[list(p) for p in members], case
+
+# contactPairs() compares every pair of members, and returns the pairs in
+# contact sorted by the first and then the second member.
+
+def contactPairs(pop):
+    pairs=[]
+    for a in range(len(pop)):
+        for b in range(a+1, len(pop)):
+            if (pop.x[a]-pop.x[b])**2+(pop.y[a]-pop.y[b])**2<= \
+               VectorEngine.CONTACT**2:
+                pairs.append((a, b))
+    return pairs
+
+@pytest.mark.parametrize("seed", range(10))
+def testFindContactsMatchesEveryPair(seed):
+    rng=np.random.default_rng(seed)
+    pop=VectorEngine.fromMembers(randomMembers(rng, 200, size=150))
+    rows, cols=VectorEngine.findContacts(pop)
+    assert list(zip(rows.tolist(), cols.tolist()))==contactPairs(pop)
+    contacts=sim.findContacts(VectorEngine.toMembers(pop))
+    assert [tuple(pair) for pair in contacts]==contactPairs(pop)
+
+@pytest.mark.parametrize("seed", range(10))
+def testResolveCollisionsMatchesCollide(seed):
+    rng=np.random.default_rng(seed)
+    pop=VectorEngine.fromMembers(randomMembers(rng, 200, size=150))
+    rows, cols=VectorEngine.findContacts(pop)
+    expected=pop.copy()
+    for a, b in zip(rows, cols):
+        VectorEngine.collide(expected, a, b)
+    VectorEngine.resolveCollisions(pop, rows, cols)
+    np.testing.assert_allclose(pop.dx, expected.dx, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(pop.dy, expected.dy, rtol=0, atol=1e-12)
+
+@pytest.mark.parametrize("seed", range(5))
+def testCheckCollisionsMatchesList(seed, elasticCollision):
+    rng=np.random.default_rng(seed)
+    members=randomMembers(rng, 200, size=150)
+    pop=VectorEngine.fromMembers(members)
+    contacts=sim.checkCollisions(members)
+    rows, cols=VectorEngine.checkCollisions(pop)
+    assert list(zip(rows.tolist(), cols.tolist()))== \
+           [tuple(pair) for pair in contacts]
+    expected=VectorEngine.fromMembers(members)
+    np.testing.assert_allclose(pop.dx, expected.dx, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(pop.dy, expected.dy, rtol=0, atol=1e-12)
+
+def testCheckCollisionsNeedsElasticCollision(monkeypatch):
+    monkeypatch.setattr(sim, "ElasticCollision", None)
+    with pytest.raises(ImportError):
+        sim.checkCollisions(randomMembers(np.random.default_rng(0), 5))